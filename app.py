@@ -4,15 +4,34 @@ import os
 import streamlit as st
 import pandas as pd
 import numpy as np
-from hashlib import md5, sha256
+from hashlib import sha256
 import json
 from PIL import Image
 import base64
+from storage import (
+    CLASS_CATEGORIES, MONEY_COLUMNS, MONTHS, RecordConflict, academic_year, academic_years,
+    generate_student_id, get_store, initialize_storage, load_years, open_academic_years, record_version
+)
+import reports  # registers the payment status view
+from fee_import import REASON_COLUMN, ROW_COLUMN, import_fees, store_rows, validate_chunk
+from fee_schedule import FEE_HEADS, current_schedule, save_schedule, suggest_schedule
 
-# Initialize or load the CSV file
-CSV_FILE = "fees_data.csv"
+# Initialize or load the fee ledger (see storage.py for the available backends)
 USER_DB_FILE = "users.json"
 
+# Page sizes offered for the record tables (second one is the default)
+RECORDS_PAGE_SIZES = [25, 50, 100, 250]
+# Ledger columns the Student Yearly Report reads
+YEARLY_REPORT_COLUMNS = [
+    "ID", "Student Name", "Class Category", "Class Section", "Month",
+    "Monthly Fee", "Annual Charges", "Admission Fee", "Received Amount"
+]
+# Columns of the Batch Entry grid; academic year and signature are set once for the batch
+BATCH_COLUMNS = [
+    "ID", "Student Name", "Class Category", "Class Section", "Month",
+    "Monthly Fee", "Annual Charges", "Admission Fee", "Received Amount", "Date"
+]
+
 # Initialize session state for authentication
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
@@ -91,112 +110,180 @@ def create_user(username, password, is_admin=False):
         return False, f"Error creating user: {str(e)}"
 
 def initialize_csv():
-    """Initialize the CSV file with proper columns if it doesn't exist"""
-    if not os.path.exists(CSV_FILE):
-        columns = [
-            "ID", "Student Name", "Class Category", "Class Section", "Month", 
-            "Monthly Fee", "Annual Charges", "Admission Fee", 
-            "Received Amount", "Date", "Signature", "Entry Timestamp"
-        ]
-        pd.DataFrame(columns=columns).to_csv(CSV_FILE, index=False)
-    else:
-        # Ensure existing CSV has all required columns
-        try:
-            df = pd.read_csv(CSV_FILE)
-            expected_columns = [
-                "ID", "Student Name", "Class Category", "Class Section", "Month", 
-                "Monthly Fee", "Annual Charges", "Admission Fee", 
-                "Received Amount", "Date", "Signature", "Entry Timestamp"
-            ]
-            
-            # Add any missing columns
-            for col in expected_columns:
-                if col not in df.columns:
-                    df[col] = np.nan
-            
-            # Save back with all columns
-            df.to_csv(CSV_FILE, index=False)
-        except Exception as e:
-            st.error(f"Error initializing CSV: {str(e)}")
-            # Create fresh file if corrupted
-            pd.DataFrame(columns=expected_columns).to_csv(CSV_FILE, index=False)
-
-def generate_student_id(student_name, class_category):
-    """Generate a unique 8-character ID based on student name and class"""
-    unique_str = f"{student_name}_{class_category}".encode('utf-8')
-    return md5(unique_str).hexdigest()[:8].upper()
+    """Initialize the fee storage with proper columns if it doesn't exist"""
+    try:
+        get_store().ensure_initialized()
+    except Exception as e:
+        # Never reset here: that would wipe the year's records and its operation log
+        st.error(f"Error initializing fee storage: {str(e)}")
+    try:
+        # Split an old single-file ledger by academic year and archive closed years
+        initialize_storage()
+    except Exception as e:
+        st.error(f"Error preparing academic years: {str(e)}")
 
 def save_to_csv(data):
     """Save data to CSV with proper validation"""
     try:
-        # Read existing data
-        if os.path.exists(CSV_FILE):
-            df = pd.read_csv(CSV_FILE)
-        else:
-            df = pd.DataFrame(columns=data.keys())
-        
-        # Convert to DataFrame and append
-        new_df = pd.DataFrame([data])
-        df = pd.concat([df, new_df], ignore_index=True)
-        
-        # Save back to CSV
-        df.to_csv(CSV_FILE, index=False)
+        get_store(data.get("Academic Year")).append(data)
         return True
     except Exception as e:
         st.error(f"Error saving data: {str(e)}")
         return False
 
-def load_data():
-    """Load data from CSV with robust error handling"""
-    if not os.path.exists(CSV_FILE):
+def import_fee_file(uploaded_file, year=None, signature=None):
+    """Bulk import an uploaded CSV/Excel file; returns (accepted, rejected) or None on error"""
+    try:
+        return import_fees(uploaded_file, uploaded_file.name, year=year, signature=signature)
+    except Exception as e:
+        st.error(f"Error importing fees: {str(e)}")
+        return None
+
+def empty_batch_rows():
+    """Blank Batch Entry grid with the column types the editor needs"""
+    return pd.DataFrame({
+        col: pd.Series(dtype='datetime64[ns]' if col == "Date" else 'float64' if col in MONEY_COLUMNS else object)
+        for col in BATCH_COLUMNS
+    })
+
+def save_fee_batch(rows, year, signature):
+    """Store every grid row with one write, or none if any row is invalid.
+
+    Returns the rejected rows (empty once saved), or None on error.
+    """
+    try:
+        accepted, rejected = validate_chunk(rows, year=year, signature=signature, first_row=1)
+        if rejected.empty:
+            store_rows(accepted)
+        return rejected
+    except Exception as e:
+        st.error(f"Error saving fee records: {str(e)}")
+        return None
+
+def load_data(columns=None, year=None):
+    """Load one academic year's data (optionally only some columns) with robust error handling"""
+    try:
+        # The stored frame is shared by all sessions; pages get their own copy to modify
+        return get_store(year).load(columns).copy()
+    except Exception as e:
+        st.error(f"Error loading data: {str(e)}")
         return pd.DataFrame()
-    
+
+def load_all_years():
+    """Load every academic year's data into one frame"""
     try:
-        # Read CSV with error handling
-        try:
-            df = pd.read_csv(CSV_FILE)
-        except pd.errors.EmptyDataError:
-            return pd.DataFrame()
-        except pd.errors.ParserError:
-            df = pd.read_csv(CSV_FILE, error_bad_lines=False)
-        
-        # Ensure all expected columns exist
-        expected_columns = [
-            "ID", "Student Name", "Class Category", "Class Section", "Month", 
-            "Monthly Fee", "Annual Charges", "Admission Fee", 
-            "Received Amount", "Date", "Signature", "Entry Timestamp"
-        ]
-        
-        for col in expected_columns:
-            if col not in df.columns:
-                df[col] = np.nan
-        
-        # Convert dates to datetime objects but keep original formatting
-        try:
-            df['Date'] = pd.to_datetime(df['Date']).dt.strftime('%d-%m-%Y')
-        except:
-            # If parsing fails, keep original date string
-            pass
-        
-        try:
-            df['Entry Timestamp'] = pd.to_datetime(df['Entry Timestamp']).dt.strftime('%d-%m-%Y %H:%M')
-        except:
-            # If parsing fails, keep original timestamp string
-            pass
-        
-        return df.dropna(how='all')  # Remove completely empty rows
-    
+        return load_years(academic_years())
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
         return pd.DataFrame()
 
-def update_data(updated_df):
-    """Update the CSV file with the modified DataFrame"""
+def load_payment_status(year=None):
+    """Load the shared students x months payment status matrix of one academic year"""
+    try:
+        return get_store(year).view("payment_status")
+    except Exception as e:
+        st.error(f"Error loading payment status: {str(e)}")
+        return None
+
+def load_student_directory(year=None):
+    """Load the shared class -> student -> records directory of one academic year"""
+    try:
+        return get_store(year).view("student_directory")
+    except Exception as e:
+        st.error(f"Error loading students: {str(e)}")
+        return None
+
+def load_student_records(year, class_category, student_name):
+    """Load the Yearly Report columns of one student's records, found through the student directory"""
+    try:
+        store = get_store(year)
+        row_ids = store.view("student_directory").rows(class_category, student_name)
+        records = store.load(YEARLY_REPORT_COLUMNS)
+        # Skip a record deleted by another session between the two reads
+        positions = records.index.get_indexer(row_ids)
+        return records.iloc[positions[positions >= 0]]
+    except Exception as e:
+        st.error(f"Error loading data: {str(e)}")
+        return pd.DataFrame(columns=YEARLY_REPORT_COLUMNS)
+
+def build_student_report(student_data, status_matrix):
+    """Everything the Student Yearly Report shows for one student, or None without records"""
+    if student_data.empty:
+        return None
+    section = student_data.iloc[0]['Class Section']
+    
+    # Dues, balances and paid/unpaid status as the payment status reports allocate them
+    monthly_report = status_matrix.student_months(student_data.iloc[0]['ID'])
+    if monthly_report is None:
+        return None
+    money = ['Monthly Fee', 'Other Charges', 'Received Amount', 'Balance Due', 'Running Balance']
+    
+    return {
+        'section': section if pd.notna(section) else 'N/A',
+        'total_monthly_fee': monthly_report['Monthly Fee'].sum(),
+        'annual_charges': student_data['Annual Charges'].iloc[0],
+        'admission_fee': student_data['Admission Fee'].iloc[0],
+        'total_received': student_data['Received Amount'].sum(),
+        'display': format_for_display(monthly_report, money),
+        'chart': monthly_report.set_index('Month')[['Monthly Fee', 'Received Amount']],
+        'csv': monthly_report.to_csv(index=False).encode('utf-8'),
+    }
+
+def load_student_report(year, class_category, student_name):
+    """One student's Yearly Report, cached while the year's records and the fee schedule are unchanged"""
+    try:
+        store = get_store(year)
+        key = (class_category, student_name, store.year, store.version(), current_schedule())
+        return reports.student_reports.get_or_build(
+            key, lambda: build_student_report(
+                load_student_records(year, class_category, student_name), store.view("payment_status")
+            )
+        )
+    except Exception as e:
+        st.error(f"Error loading student report: {str(e)}")
+        return None
+
+def load_collection_totals(year=None, all_years=False):
+    """Load the per class and month collection totals of one academic year, or of all of them"""
+    try:
+        if all_years:
+            return reports.CollectionTotals.combine(
+                get_store(fee_year).view("collection_totals") for fee_year in academic_years()
+            )
+        return get_store(year).view("collection_totals")
+    except Exception as e:
+        st.error(f"Error loading collection totals: {str(e)}")
+        return None
+
+def load_arrears_aging(year, on=None):
+    """Age every student's and class's outstanding balance in one academic year"""
+    try:
+        status_matrix = get_store(year).view("payment_status")
+        return reports.arrears_aging(status_matrix, on)
+    except Exception as e:
+        st.error(f"Error calculating arrears: {str(e)}")
+        return None
+
+def update_record(year, record_key, changes, expected_version=None):
+    """Update a single stored fee record by its academic year and Record Key"""
+    try:
+        get_store(year).update_record(record_key, changes, expected_version)
+        return True
+    except RecordConflict:
+        raise  # the edit form offers to merge or reload
+    except Exception as e:
+        st.error(f"Error updating record: {str(e)}")
+        return False
+
+def delete_record(year, record_key, expected_version=None):
+    """Delete a single stored fee record by its academic year and Record Key"""
     try:
-        updated_df.to_csv(CSV_FILE, index=False)
+        get_store(year).delete_record(record_key, expected_version)
         return True
+    except RecordConflict:
+        raise
     except Exception as e:
-        st.error(f"Error updating data: {str(e)}")
+        st.error(f"Error deleting record: {str(e)}")
         return False
 
 def format_currency(val):
@@ -206,19 +293,147 @@ def format_currency(val):
     except:
         return "Rs. 0"
 
-def style_row(row):
-    """Apply styling to DataFrame rows based on payment status"""
+def format_currency_column(values):
+    """Vectorized format_currency for a whole column"""
+    amounts = pd.to_numeric(pd.Series(values), errors='coerce').fillna(0).astype(np.int64)
+    digits = amounts.abs().astype(str).str.replace(r'\B(?=(\d{3})+$)', ',', regex=True)
+    return 'Rs. ' + pd.Series(np.where(amounts < 0, '-', ''), index=amounts.index) + digits
+
+def format_for_display(df, currency_columns=MONEY_COLUMNS):
+    """Copy of df with money as "Rs. 1,234" text and dates as dd-mm-yyyy"""
+    display = df.copy()
+    for col in currency_columns:
+        if col in display.columns:
+            display[col] = format_currency_column(display[col])
+    for col, fmt in [('Date', '%d-%m-%Y'), ('Entry Timestamp', '%d-%m-%Y %H:%M')]:
+        if col in display.columns and pd.api.types.is_datetime64_any_dtype(display[col]):
+            display[col] = display[col].dt.strftime(fmt).fillna("")
+    return display
+
+def style_rows(df, monthly_fee):
+    """Styles for a ledger table, computed for every row at once"""
+    styles = pd.DataFrame('', index=df.index, columns=df.columns)
     today = datetime.now()
-    is_between_1st_and_10th = 1 <= today.day <= 10
-    styles = [''] * len(row)
-    
-    if is_between_1st_and_10th:
-        if row['Monthly Fee'] == 0:
-            styles[0] = 'color: red'
-        else:
-            styles[0] = 'color: green'
+    if 1 <= today.day <= 10:
+        fees = pd.to_numeric(monthly_fee, errors='coerce').to_numpy()
+        styles.iloc[:, 0] = np.where(fees == 0, 'color: red', 'color: green')
     return styles
 
+def status_styles(df, paid_css='color: green', unpaid_css='color: red'):
+    """Color the Status column of a table, computed for every row at once"""
+    styles = pd.DataFrame('', index=df.index, columns=df.columns)
+    styles['Status'] = np.where(df['Status'] == 'Paid', paid_css, unpaid_css)
+    return styles
+
+def editable_values(record):
+    """The fields of a stored fee record as the edit form shows and saves them"""
+    return {
+        'Student Name': record['Student Name'],
+        'Class Category': record['Class Category'],
+        'Class Section': record['Class Section'] if pd.notna(record['Class Section']) else "",
+        'Month': record['Month'],
+        **{col: int(record[col]) for col in MONEY_COLUMNS},
+        'Date': record['Date'].strftime('%Y-%m-%d') if pd.notna(record['Date']) else "",
+        'Signature': record['Signature'],
+    }
+
+def forget_opened_record():
+    """Make the edit form read the selected record afresh on the next run"""
+    st.session_state.pop("edit_opened", None)
+    st.session_state.pop("edit_conflict", None)
+
+def show_edit_conflict(opened, conflict):
+    """Explain an edit refused because the record changed meanwhile, and offer to merge or reload"""
+    edit_year, edit_key = opened["record"]
+    current = conflict["current"]
+    if current is None:
+        st.warning("⚠️ Someone else deleted this record while you had it open. Nothing was saved.")
+        if st.button("🔄 Reload Records", key="edit_conflict_reload"):
+            forget_opened_record()
+            st.rerun()
+        return
+    
+    changes = conflict["changes"]
+    original = opened["values"]
+    theirs = editable_values(current)
+    st.warning("⚠️ Someone else changed this record after you opened it. Nothing was saved.")
+    fields = [
+        col for col in original
+        if theirs[col] != original[col] or (changes is not None and changes[col] != original[col])
+    ]
+    st.dataframe(
+        pd.DataFrame({
+            'Field': fields,
+            'When You Opened It': [original[col] for col in fields],
+            'Saved Now': [theirs[col] for col in fields],
+            'Yours': [changes[col] if changes is not None else "(delete)" for col in fields],
+        }).astype(str),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        retry_label = "🗑️ Delete Anyway" if changes is None else "🔀 Apply My Changes to the Latest Version"
+        retry_btn = st.button(retry_label, key="edit_conflict_retry")
+    with col2:
+        reload_btn = st.button("🔄 Discard Mine and Reload", key="edit_conflict_reload")
+    
+    if retry_btn:
+        try:
+            if changes is None:
+                done = delete_record(edit_year, edit_key, record_version(current))
+            else:
+                # Only the fields you changed are written; the other user's changes to the rest stay
+                mine = {col: value for col, value in changes.items() if value != original[col]}
+                mine['Entry Timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                done = update_record(edit_year, edit_key, mine, record_version(current))
+        except RecordConflict as e:
+            # Changed yet again: compare with the newest version
+            st.session_state.edit_conflict = dict(conflict, current=e.current)
+            st.rerun()
+        if done:
+            forget_opened_record()
+            st.rerun()
+    if reload_btn:
+        forget_opened_record()
+        st.rerun()
+
+def show_paged_records(df, key):
+    """Show ledger rows one page at a time; only the visible page is styled and sent"""
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+    with col1:
+        search = st.text_input("Search student name or ID", key=f"{key}_search")
+    with col2:
+        sort_by = st.selectbox("Sort by", ["Entry order"] + list(df.columns), key=f"{key}_sort")
+    with col3:
+        descending = st.checkbox("Descending", key=f"{key}_desc")
+    with col4:
+        page_size = st.selectbox("Rows per page", RECORDS_PAGE_SIZES, index=1, key=f"{key}_page_size")
+    
+    filtered = reports.filter_records(
+        df,
+        search=search,
+        sort_by=None if sort_by == "Entry order" else sort_by,
+        ascending=not descending
+    )
+    if sort_by == "Entry order" and descending:
+        filtered = filtered.iloc[::-1]
+    
+    total_pages = reports.page_count(len(filtered), page_size)
+    page = st.number_input("Page", min_value=1, max_value=total_pages, value=1, step=1, key=f"{key}_page")
+    page_df, page = reports.page_of(filtered, page, page_size)
+    
+    st.dataframe(
+        format_for_display(page_df).style.apply(style_rows, axis=None, monthly_fee=page_df['Monthly Fee']),
+        use_container_width=True
+    )
+    if len(filtered):
+        first_row = (page - 1) * page_size + 1
+        st.caption(f"Showing rows {first_row}-{first_row + len(page_df) - 1} of {len(filtered)} (page {page} of {total_pages})")
+    else:
+        st.caption("No matching records")
+
 def home_page():
     """Display beautiful home page with logo"""
     st.set_page_config(page_title="School Fees Management", layout="wide", page_icon="🏫")
@@ -393,6 +608,123 @@ def login_page():
             else:
                 st.error("Invalid username or password")
 
+def arrears_aging_report(year):
+    """Admin report of outstanding balances by how long they have been due"""
+    st.header("⏳ Arrears Aging")
+    labels = [label for label, _ in reports.AGING_BUCKETS]
+    st.write("Unpaid fees by how many months ago they fell due: the month in progress is Current. "
+             "Months that have not started yet are not counted.")
+    
+    as_of = st.date_input("Aged as of", value=datetime.now().date(), key="aging_as_of")
+    aging = load_arrears_aging(year, as_of)
+    if aging is None:
+        return
+    students, classes = aging
+    if students.empty:
+        st.info("No fee records found")
+        return
+    
+    # School-wide totals per bucket
+    cols = st.columns(len(labels) + 1)
+    for col, label in zip(cols, labels + ['Total Outstanding']):
+        with col:
+            st.metric(label, format_currency(classes[label].sum()))
+    
+    st.subheader("🏫 By Class")
+    st.dataframe(
+        format_for_display(classes, labels + ['Total Outstanding']),
+        use_container_width=True,
+        hide_index=True
+    )
+    st.bar_chart(classes.set_index('Class Category')[labels])
+    
+    st.subheader("👨‍🎓 By Student")
+    selected_class = st.selectbox("Class", ["All Classes"] + list(classes['Class Category']), key="aging_class")
+    in_arrears = students[students['Total Outstanding'] > 0]
+    if selected_class != "All Classes":
+        in_arrears = in_arrears[in_arrears['Class Category'] == selected_class]
+    # Oldest debts first
+    in_arrears = in_arrears.sort_values(labels[::-1], ascending=False)
+    if in_arrears.empty:
+        st.success("✅ No outstanding balances")
+    else:
+        st.dataframe(
+            format_for_display(in_arrears.drop(columns=['ID']), labels + ['Total Outstanding']),
+            use_container_width=True,
+            hide_index=True
+        )
+    
+    csv = students.to_csv(index=False).encode('utf-8')
+    st.download_button(
+        label="📥 Download Arrears Aging",
+        data=csv,
+        file_name=f"arrears_aging_{year}.csv",
+        mime="text/csv"
+    )
+
+def fee_schedule_page(year):
+    """Admin interface for the fee schedule that sets what students owe"""
+    st.header("🗓️ Fee Schedule")
+    st.write("What each class is charged per fee head in each academic year. To change a fee during "
+             "the year, add a row with a later Effective From; it applies from the first month starting "
+             "on or after that date. Months without a fee record owe the scheduled Monthly Fee. Annual "
+             "Charges and Admission Fee are due once, in the month of their Effective From (the first "
+             "month if blank), from every student without that charge recorded.")
+    
+    if "schedule_saved" in st.session_state:
+        st.success(f"✅ Saved {st.session_state.pop('schedule_saved')} fee schedule entries")
+    try:
+        schedule = current_schedule()
+    except Exception as e:
+        st.error(f"Error loading fee schedule: {str(e)}")
+        return
+    if "schedule_rows" not in st.session_state:
+        st.session_state.schedule_rows = schedule.entries
+    
+    if st.button(f"✨ Suggest {year} Monthly Fees from Recorded Fees"):
+        # Classes already scheduled for the year keep their entries
+        rows = st.session_state.schedule_rows
+        scheduled = rows.loc[(rows['Academic Year'] == year) & (rows['Fee Head'] == 'Monthly Fee'), 'Class Category']
+        suggested = suggest_schedule(load_data(['Class Category', 'Monthly Fee'], year), year)
+        suggested = suggested[~suggested['Class Category'].isin(scheduled)]
+        st.session_state.schedule_rows = pd.concat([rows, suggested], ignore_index=True)
+        st.session_state.pop("schedule_editor", None)
+        st.rerun()
+    
+    edited = st.data_editor(
+        st.session_state.schedule_rows,
+        key="schedule_editor",
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "Class Category": st.column_config.SelectboxColumn("Class Category", options=CLASS_CATEGORIES, required=True),
+            "Academic Year": st.column_config.SelectboxColumn("Academic Year", options=academic_years(), required=True),
+            "Fee Head": st.column_config.SelectboxColumn("Fee Head", options=FEE_HEADS, required=True),
+            "Amount": st.column_config.NumberColumn("Amount", min_value=0, step=1, format="%d", required=True),
+            "Effective From": st.column_config.DateColumn("Effective From"),
+        }
+    )
+    
+    if st.button("💾 Save Fee Schedule", type="primary"):
+        try:
+            saved = save_schedule(edited)
+            st.session_state.schedule_saved = len(saved.entries)
+            st.session_state.pop("schedule_rows", None)
+            st.session_state.pop("schedule_editor", None)
+            st.rerun()
+        except Exception as e:
+            st.error(f"Error saving fee schedule: {str(e)}")
+    
+    # Monthly fee due per class and month of the selected year, as the reports use it
+    classes, table = schedule.monthly_table(year)
+    if classes:
+        st.subheader(f"Monthly Fees Due in {year}")
+        st.dataframe(
+            pd.DataFrame(table, index=pd.Index(classes, name='Class Category'), columns=MONTHS),
+            use_container_width=True
+        )
+
 def user_management():
     """Admin interface for user management"""
     st.header("👥 User Management")
@@ -525,22 +857,15 @@ def main_app():
         st.rerun()
     
     if st.session_state.is_admin:
-        menu_options = ["Enter Fees", "View All Records", "Paid & Unpaid Students Record", "Student Yearly Report", "User Management"]
+        menu_options = ["Enter Fees", "Batch Entry", "Bulk Import", "View All Records", "Paid & Unpaid Students Record", "Student Yearly Report", "Arrears Aging", "Fee Schedule", "User Management"]
     else:
-        menu_options = ["Enter Fees", "View All Records", "Student Yearly Report"]
+        menu_options = ["Enter Fees", "Batch Entry", "Bulk Import", "View All Records", "Student Yearly Report"]
     
     menu = st.sidebar.selectbox("Menu", menu_options)
     
-    CLASS_CATEGORIES = [
-        "Nursery", "KGI", "KGII", 
-        "Class 1", "Class 2", "Class 3", "Class 4", "Class 5",
-        "Class 6", "Class 7", "Class 8", "Class 9", "Class 10 (Matric)"
-    ]
-    
-    months = [
-        "APRIL", "MAY", "JUNE", "JULY", "AUGUST", "SEPTEMBER",
-        "OCTOBER", "NOVEMBER", "DECEMBER", "JANUARY", "FEBRUARY", "MARCH"
-    ]
+    # Pages read only the selected academic year's partition
+    years = academic_years()
+    selected_year = st.sidebar.selectbox("Academic Year", years, index=years.index(academic_year()))
     
     if menu == "Enter Fees":
         st.header("➕ Enter Fee Details")
@@ -553,7 +878,11 @@ def main_app():
                 class_category = st.selectbox("Class Category*", CLASS_CATEGORIES)
                 class_section = st.text_input("Class Section", placeholder="A, B, etc. (if applicable)")
             
-            selected_month = st.selectbox("Select Month*", months)
+            col_month, col_year = st.columns(2)
+            with col_month:
+                selected_month = st.selectbox("Select Month*", MONTHS)
+            with col_year:
+                fee_year = st.selectbox("Academic Year*", open_academic_years())
             
             col3, col4 = st.columns(2)
             with col3:
@@ -588,58 +917,237 @@ def main_app():
                         "Received Amount": received_amount,
                         "Date": payment_date.strftime("%Y-%m-%d"),
                         "Signature": signature,
-                        "Entry Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                        "Entry Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "Academic Year": fee_year
                     }
                     
                     if save_to_csv(fee_data):
                         st.success("✅ Fee record saved successfully!")
                         st.balloons()
     
+    elif menu == "Batch Entry":
+        st.header("🧾 Batch Fee Entry")
+        st.write("Enter several months or several students at once. Nothing is saved until you press "
+                 "Save All Rows, and then every row is saved together.")
+        
+        if "batch_saved" in st.session_state:
+            st.success(f"✅ Saved {st.session_state.pop('batch_saved')} fee records")
+        if "batch_rows" not in st.session_state:
+            st.session_state.batch_rows = empty_batch_rows()
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            batch_year = st.selectbox("Academic Year*", open_academic_years(), key="batch_year")
+        with col2:
+            batch_signature = st.text_input("Received By (Signature)*", value=st.session_state.current_user, key="batch_signature")
+        with col3:
+            batch_date = st.date_input("Payment Date", value=datetime.now(), key="batch_date")
+        
+        # The quick-fill form is drawn above the grid but needs the grid's current rows
+        fill_area = st.container()
+        
+        edited = st.data_editor(
+            st.session_state.batch_rows,
+            key="batch_editor",
+            num_rows="dynamic",
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "Student Name": st.column_config.TextColumn("Student Name*"),
+                "Class Category": st.column_config.SelectboxColumn("Class Category*", options=CLASS_CATEGORIES),
+                "Month": st.column_config.SelectboxColumn("Month*", options=MONTHS),
+                **{col: st.column_config.NumberColumn(col, min_value=0, step=1, default=0, format="%d") for col in MONEY_COLUMNS},
+                "Date": st.column_config.DateColumn("Payment Date", default=batch_date),
+            }
+        )
+        
+        # Rows without a student name are treated as blank
+        rows = edited[edited['Student Name'].fillna('').astype(str).str.strip() != '']
+        
+        with fill_area:
+            with st.expander("➕ Add several months for one student", expanded=False):
+                with st.form("batch_fill_form", clear_on_submit=True):
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        fill_name = st.text_input("Student Name*")
+                        fill_class = st.selectbox("Class Category*", CLASS_CATEGORIES)
+                        fill_section = st.text_input("Class Section")
+                    with col2:
+                        fill_months = st.multiselect("Months*", MONTHS)
+                        fill_fee = st.number_input("Monthly Fee", min_value=0, value=0)
+                        fill_paid = st.checkbox("Paid in full", value=True)
+                    
+                    if st.form_submit_button("➕ Add Rows"):
+                        if not fill_name or not fill_months:
+                            st.error("Enter a student name and at least one month")
+                        else:
+                            new_rows = pd.DataFrame({
+                                "Student Name": fill_name,
+                                "Class Category": fill_class,
+                                "Class Section": fill_section,
+                                "Month": fill_months,
+                                "Monthly Fee": float(fill_fee),
+                                "Annual Charges": 0.0,
+                                "Admission Fee": 0.0,
+                                "Received Amount": float(fill_fee) if fill_paid else 0.0,
+                                "Date": pd.Timestamp(batch_date),
+                            })
+                            st.session_state.batch_rows = pd.concat([rows, new_rows], ignore_index=True)
+                            # Let the grid start over from the updated rows
+                            st.session_state.pop("batch_editor", None)
+                            st.rerun()
+        
+        # Live totals for the rows entered so far
+        amounts = rows[MONEY_COLUMNS].fillna(0)
+        total_due = amounts[['Monthly Fee', 'Annual Charges', 'Admission Fee']].sum().sum()
+        total_received = amounts['Received Amount'].sum()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Rows", len(rows))
+        with col2:
+            st.metric("Total Due", format_currency(total_due))
+        with col3:
+            st.metric("Total Received", format_currency(total_received))
+        with col4:
+            st.metric("Balance", format_currency(total_due - total_received))
+        
+        if not rows.empty:
+            per_student = amounts.groupby(rows['Student Name'].str.strip()).sum()
+            per_student.insert(0, 'Months', rows.groupby(rows['Student Name'].str.strip()).size())
+            st.dataframe(
+                format_for_display(per_student.reset_index()),
+                use_container_width=True,
+                hide_index=True
+            )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            save_batch_btn = st.button("💾 Save All Rows", type="primary")
+        with col2:
+            clear_batch_btn = st.button("🗑️ Clear Grid")
+        
+        if clear_batch_btn:
+            st.session_state.batch_rows = empty_batch_rows()
+            st.session_state.pop("batch_editor", None)
+            st.rerun()
+        
+        if save_batch_btn:
+            if rows.empty:
+                st.warning("Add at least one row with a student name")
+            elif not batch_signature:
+                st.error("Please fill the Received By (Signature) field")
+            else:
+                rejected = save_fee_batch(rows.fillna({'Date': pd.Timestamp(batch_date)}), batch_year, batch_signature)
+                if rejected is not None and rejected.empty:
+                    st.session_state.batch_saved = len(rows)
+                    st.session_state.batch_rows = empty_batch_rows()
+                    st.session_state.pop("batch_editor", None)
+                    st.rerun()
+                elif rejected is not None:
+                    st.error(f"{len(rejected)} rows need fixing; nothing was saved")
+                    st.dataframe(
+                        rejected[[ROW_COLUMN, 'Student Name', 'Month', REASON_COLUMN]],
+                        use_container_width=True,
+                        hide_index=True
+                    )
+    
+    elif menu == "Bulk Import":
+        st.header("📥 Bulk Import Fee Records")
+        st.write("Upload a CSV or Excel file with the same columns as the fee records download. "
+                 "Rows are checked before anything is saved; rows with problems are listed below and skipped.")
+        
+        uploaded_file = st.file_uploader("Fee records file", type=["csv", "xlsx"])
+        col1, col2 = st.columns(2)
+        with col1:
+            import_year = st.selectbox("Academic Year", ["From payment date"] + open_academic_years())
+        with col2:
+            import_signature = st.text_input("Received By (for rows without a Signature)", value=st.session_state.current_user)
+        
+        if uploaded_file is not None and st.button("📥 Import Records"):
+            result = import_fee_file(
+                uploaded_file,
+                year=None if import_year == "From payment date" else import_year,
+                signature=import_signature or None
+            )
+            if result is not None:
+                accepted, rejected = result
+                st.success(f"✅ Imported {len(accepted)} fee records")
+                if len(rejected):
+                    st.warning(f"{len(rejected)} rows were rejected")
+                    st.dataframe(rejected, use_container_width=True, hide_index=True)
+                    st.download_button(
+                        label="📥 Download Rejected Rows",
+                        data=rejected.to_csv(index=False).encode('utf-8'),
+                        file_name="rejected_fee_rows.csv",
+                        mime="text/csv"
+                    )
+    
     elif menu == "View All Records":
         st.header("👀 View All Fee Records")
         
-        df = load_data()
+        all_years = st.checkbox("Include all academic years", key="records_all_years")
+        df = load_all_years() if all_years else load_data(year=selected_year)
         if df.empty:
             st.info("No fee records found")
         else:
-            # Create tabs for each class category
-            tabs = st.tabs(["All Records"] + CLASS_CATEGORIES)
+            # Class "tabs": only the selected one is computed and rendered
+            selected_tab = st.radio(
+                "Class",
+                ["All Records"] + CLASS_CATEGORIES,
+                horizontal=True,
+                key="records_tab",
+                label_visibility="collapsed"
+            )
             
-            with tabs[0]:
+            if selected_tab == "All Records":
                 st.subheader("All Fee Records")
                 
                 with st.expander("📝 Edit/Delete Records", expanded=False):
                     st.write("Select a record to edit or delete:")
                     
-                    edit_index = st.selectbox(
+                    # Labels are built once per run instead of looked up per option;
+                    # a record is identified by its academic year and Record Key
+                    record_labels = dict(zip(
+                        zip(df['Academic Year'], df['Record Key']),
+                        df['Student Name'].astype(str) + " - " + df['Class Category'].astype(str) + " - "
+                        + df['Month'].astype(str) + " " + df['Academic Year'].astype(str)
+                    ))
+                    edit_year, edit_key = st.selectbox(
                         "Select Record",
-                        options=df.index,
-                        format_func=lambda x: f"{df.loc[x, 'Student Name']} - {df.loc[x, 'Class Category']} - {df.loc[x, 'Month']}"
+                        options=list(record_labels),
+                        format_func=record_labels.get
                     )
                     
+                    # The form shows the record as it was when it was picked, and its version
+                    # stamp goes back with the change: if someone else saved the record in
+                    # the meantime, nothing is overwritten and a merge is offered instead
+                    opened = st.session_state.get("edit_opened")
+                    if opened is None or opened["record"] != (edit_year, edit_key):
+                        edit_store = get_store(edit_year)
+                        current = edit_store.load().loc[edit_store.locate(edit_key)]
+                        opened = {
+                            "record": (edit_year, edit_key),
+                            "values": editable_values(current),
+                            "version": record_version(current),
+                        }
+                        st.session_state.edit_opened = opened
+                        st.session_state.pop("edit_conflict", None)
+                    record = opened["values"]
+                    
                     with st.form("edit_form"):
-                        record = df.loc[edit_index]
-                        
                         col1, col2 = st.columns(2)
                         with col1:
                             edit_name = st.text_input("Student Name", value=record['Student Name'])
                             edit_class = st.selectbox("Class Category", CLASS_CATEGORIES, index=CLASS_CATEGORIES.index(record['Class Category']))
                             edit_section = st.text_input("Class Section", value=record['Class Section'])
-                            edit_month = st.selectbox("Month", months, index=months.index(record['Month']))
+                            edit_month = st.selectbox("Month", MONTHS, index=MONTHS.index(record['Month']))
                         with col2:
                             edit_monthly_fee = st.number_input("Monthly Fee", value=record['Monthly Fee'])
                             edit_annual_charges = st.number_input("Annual Charges", value=record['Annual Charges'])
                             edit_admission_fee = st.number_input("Admission Fee", value=record['Admission Fee'])
                             edit_received = st.number_input("Received Amount", value=record['Received Amount'])
                         
-                        # Handle date parsing
-                        try:
-                            edit_date_value = datetime.strptime(record['Date'], '%d-%m-%Y')
-                        except:
-                            try:
-                                edit_date_value = datetime.strptime(record['Date'], '%Y-%m-%d')
-                            except:
-                                edit_date_value = datetime.now()
+                        edit_date_value = pd.Timestamp(record['Date']) if record['Date'] else datetime.now()
                         
                         edit_date = st.date_input("Payment Date", value=edit_date_value)
                         edit_signature = st.text_input("Received By (Signature)", value=record['Signature'])
@@ -651,69 +1159,78 @@ def main_app():
                             delete_btn = st.form_submit_button("🗑️ Delete Record")
                         
                         if update_btn:
-                            df.loc[edit_index, 'Student Name'] = edit_name
-                            df.loc[edit_index, 'Class Category'] = edit_class
-                            df.loc[edit_index, 'Class Section'] = edit_section
-                            df.loc[edit_index, 'Month'] = edit_month
-                            df.loc[edit_index, 'Monthly Fee'] = edit_monthly_fee
-                            df.loc[edit_index, 'Annual Charges'] = edit_annual_charges
-                            df.loc[edit_index, 'Admission Fee'] = edit_admission_fee
-                            df.loc[edit_index, 'Received Amount'] = edit_received
-                            df.loc[edit_index, 'Date'] = edit_date.strftime('%d-%m-%Y')
-                            df.loc[edit_index, 'Signature'] = edit_signature
-                            df.loc[edit_index, 'Entry Timestamp'] = datetime.now().strftime('%d-%m-%Y %H:%M')
+                            changes = {
+                                'Student Name': edit_name,
+                                'Class Category': edit_class,
+                                'Class Section': edit_section,
+                                'Month': edit_month,
+                                'Monthly Fee': edit_monthly_fee,
+                                'Annual Charges': edit_annual_charges,
+                                'Admission Fee': edit_admission_fee,
+                                'Received Amount': edit_received,
+                                'Date': edit_date.strftime('%Y-%m-%d'),
+                                'Signature': edit_signature
+                            }
                             
-                            if update_data(df):
+                            try:
+                                saved = update_record(edit_year, edit_key, dict(
+                                    changes, **{'Entry Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+                                ), opened["version"])
+                            except RecordConflict as e:
+                                saved = False
+                                st.session_state.edit_conflict = {"record": opened["record"], "changes": changes, "current": e.current}
+                            if saved:
+                                forget_opened_record()
                                 st.success("✅ Record updated successfully!")
                                 st.rerun()
                         
                         if delete_btn:
-                            df = df.drop(index=edit_index)
-                            if update_data(df):
+                            try:
+                                deleted = delete_record(edit_year, edit_key, opened["version"])
+                            except RecordConflict as e:
+                                deleted = False
+                                st.session_state.edit_conflict = {"record": opened["record"], "changes": None, "current": e.current}
+                            if deleted:
+                                forget_opened_record()
                                 st.success("✅ Record deleted successfully!")
                                 st.rerun()
+                    
+                    conflict = st.session_state.get("edit_conflict")
+                    if conflict is not None and conflict["record"] == opened["record"]:
+                        show_edit_conflict(opened, conflict)
                 
-                # Display styled dataframe
-                st.dataframe(
-                    df.style.apply(style_row, axis=1).format({
-                        'Monthly Fee': format_currency,
-                        'Annual Charges': format_currency,
-                        'Admission Fee': format_currency,
-                        'Received Amount': format_currency
-                    }),
-                    use_container_width=True
-                )
-            
-            for i, category in enumerate(CLASS_CATEGORIES, start=1):
-                with tabs[i]:
-                    st.subheader(f"{category} Records")
-                    class_df = df[df['Class Category'] == category]
+                # Display one page of the styled ledger
+                show_paged_records(df, key="all_records")
+            else:
+                category = selected_tab
+                st.subheader(f"{category} Records")
+                class_df = df[df['Class Category'] == category]
+                
+                if not class_df.empty:
+                    show_paged_records(class_df, key=f"class_records_{category}")
                     
-                    if not class_df.empty:
-                        st.dataframe(
-                            class_df.style.apply(style_row, axis=1).format({
-                                'Monthly Fee': format_currency,
-                                'Annual Charges': format_currency,
-                                'Admission Fee': format_currency,
-                                'Received Amount': format_currency
-                            }),
-                            use_container_width=True
-                        )
-                        
+                    # Summary numbers come from the totals kept up to date on every write
+                    totals = load_collection_totals(selected_year, all_years)
+                    if totals is not None:
+                        summary = totals.class_summary(category)
                         st.subheader("Summary")
                         col1, col2, col3 = st.columns(3)
                         with col1:
-                            st.metric("Total Students", class_df['Student Name'].nunique())
+                            st.metric("Total Students", summary['Students'])
                         with col2:
-                            st.metric("Total Received", format_currency(class_df['Received Amount'].sum()))
+                            st.metric("Total Received", format_currency(summary['Received']))
                         with col3:
-                            unpaid = class_df[class_df['Monthly Fee'] == 0]['Student Name'].nunique()
-                            st.metric("Unpaid Students", unpaid, delta_color="inverse")
+                            st.metric("Unpaid Students", summary['Unbilled Students'], delta_color="inverse")
                         
                         st.write("Monthly Collection:")
-                        monthly_summary = class_df.groupby('Month')['Received Amount'].sum().reset_index()
-                        st.bar_chart(monthly_summary.set_index('Month'))
-            
+                        monthly_summary = totals.monthly(category)
+                        st.bar_chart(monthly_summary['Received'])
+                        st.dataframe(
+                            format_for_display(monthly_summary.reset_index(), currency_columns=['Expected', 'Received']),
+                            use_container_width=True,
+                            hide_index=True
+                        )
+        
             st.divider()
             csv = df.to_csv(index=False).encode('utf-8')
             st.download_button(
@@ -725,127 +1242,68 @@ def main_app():
 
     elif menu == "Paid & Unpaid Students Record":
         st.header("✅ Paid & ❌ Unpaid Students Record")
-        df = load_data()
+        status_matrix = load_payment_status(selected_year)
         
-        if df.empty:
+        if status_matrix is None or status_matrix.n == 0:
             st.info("No fee records found")
         else:
-            # Calculate outstanding amount for each record
-            df['Outstanding'] = df['Monthly Fee'] - df['Received Amount']
-            
-            # Get all unique students
-            all_students = df[['ID', 'Student Name', 'Class Category']].drop_duplicates()
-            
-            # Get all months in the academic year
-            MONTHS = ["APRIL", "MAY", "JUNE", "JULY", "AUGUST", "SEPTEMBER", 
-                     "OCTOBER", "NOVEMBER", "DECEMBER", "JANUARY", "FEBRUARY", "MARCH"]
-            
-            # Create a DataFrame with all possible student-month combinations
-            all_combinations = pd.DataFrame([
-                (student['ID'], student['Student Name'], student['Class Category'], month)
-                for _, student in all_students.iterrows()
-                for month in MONTHS
-            ], columns=['ID', 'Student Name', 'Class Category', 'Month'])
-            
-            # Merge with actual payments
-            merged = pd.merge(all_combinations, 
-                             df[['ID', 'Month', 'Monthly Fee', 'Received Amount', 'Outstanding']],
-                             on=['ID', 'Month'], 
-                             how='left')
-            
-            # Get each student's standard monthly fee (first recorded fee)
-            student_fees = df.groupby('ID')['Monthly Fee'].first().reset_index()
-            merged = pd.merge(merged, student_fees, on='ID', how='left')
-            
-            # Calculate payment status
-            merged['Status'] = 'Unpaid'
-            merged.loc[merged['Outstanding'] <= 0, 'Status'] = 'Paid'
-            merged.loc[merged['Outstanding'].isna() & (merged['Monthly Fee_y'] > 0), 'Outstanding'] = merged['Monthly Fee_y']
-            
+            st.caption("Each student's payments, including annual charges and admission fees, are applied "
+                       "to their oldest dues first, so an overpayment settles later months.")
             # Create tabs for each month
             tabs = st.tabs(MONTHS)
             
             for i, month in enumerate(MONTHS):
                 with tabs[i]:
-                    month_data = merged[merged['Month'] == month].copy()
+                    display_df = status_matrix.month_frame(month).drop(columns=['ID'])
                     
-                    if not month_data.empty:
-                        # Calculate summary stats
-                        total_students = len(month_data)
-                        paid_students = len(month_data[month_data['Status'] == 'Paid'])
-                        unpaid_students = total_students - paid_students
-                        total_outstanding = month_data[month_data['Status'] == 'Unpaid']['Monthly Fee_y'].sum()
-                        
-                        # Display summary metrics
-                        col1, col2, col3 = st.columns(3)
-                        with col1:
-                            st.metric("Total Students", total_students)
-                        with col2:
-                            st.metric("Paid Students", paid_students)
-                        with col3:
-                            st.metric("Unpaid Students", unpaid_students, 
-                                      delta=f"Rs. {int(total_outstanding):,}" if total_outstanding > 0 else None)
-                        
-                        # Display the data with color coding
-                        def color_status(val):
-                            color = 'green' if val == 'Paid' else 'red'
-                            return f'color: {color}'
-                        
-                        display_df = month_data[['Student Name', 'Class Category', 'Monthly Fee_y', 'Received Amount', 'Outstanding', 'Status']]
-                        display_df = display_df.rename(columns={
-                            'Monthly Fee_y': 'Monthly Fee',
-                            'Received Amount': 'Amount Paid',
-                            'Outstanding': 'Balance Due'
-                        })
-                        
-                        st.dataframe(
-                            display_df.style.format({
-                                'Monthly Fee': format_currency,
-                                'Amount Paid': format_currency,
-                                'Balance Due': format_currency
-                            }).applymap(color_status, subset=['Status']),
-                            use_container_width=True
-                        )
-                        
-                        # Download button for this month's data
-                        csv = display_df.to_csv(index=False).encode('utf-8')
-                        st.download_button(
-                            label=f"📥 Download {month} Data",
-                            data=csv,
-                            file_name=f"{month.lower()}_payment_status.csv",
-                            mime="text/csv"
-                        )
+                    # Calculate summary stats
+                    total_students = len(display_df)
+                    paid_students = int((display_df['Status'] == 'Paid').sum())
+                    unpaid_students = total_students - paid_students
+                    total_outstanding = display_df.loc[display_df['Status'] == 'Unpaid', 'Balance Due'].clip(lower=0).sum()
+                    
+                    # Display summary metrics
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Total Students", total_students)
+                    with col2:
+                        st.metric("Paid Students", paid_students)
+                    with col3:
+                        st.metric("Unpaid Students", unpaid_students, 
+                                  delta=f"Rs. {int(total_outstanding):,}" if total_outstanding > 0 else None)
+                    
+                    # Display the data with color coding
+                    st.dataframe(
+                        format_for_display(display_df, ['Monthly Fee', 'Other Charges', 'Amount Paid', 'Balance Due'])
+                        .style.apply(status_styles, axis=None),
+                        use_container_width=True
+                    )
+                    
+                    # Download button for this month's data
+                    csv = display_df.to_csv(index=False).encode('utf-8')
+                    st.download_button(
+                        label=f"📥 Download {month} Data",
+                        data=csv,
+                        file_name=f"{month.lower()}_payment_status.csv",
+                        mime="text/csv"
+                    )
             
             # Overall summary across all months
             st.subheader("🎯 Overall Payment Status")
             
-            # Calculate unpaid months per student
-            student_summary = merged.groupby(['ID', 'Student Name', 'Class Category'])['Status'].apply(
-                lambda x: (x == 'Unpaid').sum()
-            ).reset_index()
-            student_summary.columns = ['ID', 'Student Name', 'Class Category', 'Unpaid Months']
-            
-            # Calculate total outstanding per student
-            student_outstanding = merged[merged['Status'] == 'Unpaid'].groupby(
-                ['ID', 'Student Name', 'Class Category']
-            )['Monthly Fee_y'].sum().reset_index()
-            student_outstanding.columns = ['ID', 'Student Name', 'Class Category', 'Total Outstanding']
-            
-            # Merge the data
-            student_summary = pd.merge(student_summary, student_outstanding, 
-                                     on=['ID', 'Student Name', 'Class Category'],
-                                     how='left').fillna(0)
+            # Unpaid months, outstanding balance and credit per student, from the cached FIFO allocation
+            student_summary = status_matrix.student_summary()
             
             # Display summary
             st.dataframe(
-                student_summary.style.format({'Total Outstanding': format_currency}),
+                format_for_display(student_summary, ['Total Outstanding', 'Credit']),
                 use_container_width=True
             )
             
             # Download all data
-            csv = merged[['Student Name', 'Class Category', 'Month', 'Monthly Fee_y', 
-                         'Received Amount', 'Outstanding', 'Status']]\
-                  .rename(columns={'Monthly Fee_y': 'Monthly Fee'})\
+            csv = status_matrix.to_grid()[['Student Name', 'Class Category', 'Month', 'Expected Fee', 'Other Charges',
+                                           'Received Amount', 'Outstanding', 'Running Balance', 'Status']]\
+                  .rename(columns={'Expected Fee': 'Monthly Fee'})\
                   .to_csv(index=False).encode('utf-8')
             st.download_button(
                 label="📥 Download Complete Payment Records",
@@ -857,16 +1315,18 @@ def main_app():
     elif menu == "Student Yearly Report":
         st.header("📊 Student Yearly Fee Report")
         
-        df = load_data()
-        if df.empty:
+        # Classes, students and each student's records are looked up in the
+        # student directory instead of filtering the whole ledger
+        directory = load_student_directory(selected_year)
+        if directory is None or not directory.classes():
             st.info("No fee records found")
         else:
             # Step 1: Show all classes with records
-            all_classes = sorted(df['Class Category'].unique())
+            all_classes = directory.classes()
             selected_class = st.selectbox("Select Class", all_classes, key="class_selector")
             
             # Step 2: Show all students in selected class
-            class_students = sorted(df[df['Class Category'] == selected_class]['Student Name'].unique())
+            class_students = directory.students(selected_class)
             
             if not class_students:
                 st.warning(f"No students found in {selected_class}")
@@ -874,10 +1334,9 @@ def main_app():
                 selected_student = st.selectbox("Select Student", class_students, key="student_selector")
                 
                 # Step 3: Show yearly report for selected student
-                student_data = df[(df['Student Name'] == selected_student) & 
-                                (df['Class Category'] == selected_class)]
+                report = load_student_report(selected_year, selected_class, selected_student)
                 
-                if student_data.empty:
+                if report is None:
                     st.warning(f"No records found for {selected_student} in {selected_class}")
                 else:
                     # Display student info
@@ -886,79 +1345,54 @@ def main_app():
                     with col1:
                         st.write(f"**Class:** {selected_class}")
                     with col2:
-                        section = student_data.iloc[0]['Class Section'] if 'Class Section' in student_data.columns else 'N/A'
-                        st.write(f"**Section:** {section if pd.notna(section) else 'N/A'}")
+                        st.write(f"**Section:** {report['section']}")
                     
                     # Yearly summary
                     st.subheader("Fee Summary")
                     
-                    
-                    # Calculate totals
-                    total_monthly_fee = student_data['Monthly Fee'].sum()
-                    annual_charges = student_data['Annual Charges'].iloc[0] if 'Annual Charges' in student_data.columns else 0
-                    admission_fee = student_data['Admission Fee'].iloc[0] if 'Admission Fee' in student_data.columns else 0
-                    total_received = student_data['Received Amount'].sum()
-                    
                     # Display totals
                     col1, col2, col3, col4 = st.columns(4)
                     with col1:
-                        st.metric("Total Monthly Fee", format_currency(total_monthly_fee))
+                        st.metric("Total Monthly Fee", format_currency(report['total_monthly_fee']))
                     with col2:
-                        st.metric("Annual Charges", format_currency(annual_charges))
+                        st.metric("Annual Charges", format_currency(report['annual_charges']))
                     with col3:
-                        st.metric("Admission Fee", format_currency(admission_fee))
+                        st.metric("Admission Fee", format_currency(report['admission_fee']))
                     with col4:
-                        st.metric("Total Received", format_currency(total_received))
+                        st.metric("Total Received", format_currency(report['total_received']))
                     
                     # Monthly fee details
                     st.subheader("Monthly Fee Details")
-                    
-                    all_months = [
-                        "APRIL", "MAY", "JUNE", "JULY", "AUGUST", "SEPTEMBER",
-                        "OCTOBER", "NOVEMBER", "DECEMBER", "JANUARY", "FEBRUARY", "MARCH"
-                    ]
-                    
-                    monthly_report = pd.DataFrame({'Month': all_months})
-                    monthly_data = student_data.groupby('Month').agg({
-                        'Monthly Fee': 'sum',
-                        'Received Amount': 'sum'
-                    }).reset_index()
-                    
-                    monthly_report = monthly_report.merge(monthly_data, on='Month', how='left').fillna(0)
-                    monthly_report['Status'] = monthly_report.apply(
-                        lambda row: 'Paid' if row['Monthly Fee'] > 0 else 'Unpaid', 
-                        axis=1
-                    )
-                    
-                    def color_unpaid(val):
-                        if val == 'Unpaid':
-                            return 'color: red'
-                        return ''
-                    
                     st.dataframe(
-                        monthly_report.style
-                        .applymap(color_unpaid, subset=['Status'])
-                        .format({
-                            'Monthly Fee': format_currency,
-                            'Received Amount': format_currency
-                        }),
+                        report['display'].style.apply(status_styles, axis=None, paid_css=''),
                         use_container_width=True
                     )
                     
                     # Visualizations
                     st.subheader("Payment Trends")
-                    st.line_chart(monthly_report.set_index('Month')[['Monthly Fee', 'Received Amount']])
+                    st.line_chart(report['chart'])
                     
                     # Download student report
                     st.divider()
-                    csv = monthly_report.to_csv(index=False).encode('utf-8')
                     st.download_button(
                         label="📥 Download Student Report",
-                        data=csv,
+                        data=report['csv'],
                         file_name=f"{selected_student}_fee_report.csv",
                         mime="text/csv"
                     )
 
+    elif menu == "Arrears Aging":
+        if st.session_state.is_admin:
+            arrears_aging_report(selected_year)
+        else:
+            st.warning("⚠️ You don't have permission to access this page")
+
+    elif menu == "Fee Schedule":
+        if st.session_state.is_admin:
+            fee_schedule_page(selected_year)
+        else:
+            st.warning("⚠️ You don't have permission to access this page")
+
     elif menu == "User Management":
         if st.session_state.is_admin:
             user_management()
@@ -0,0 +1,87 @@
+"""Time the arrears aging buckets against a per-student loop.
+
+    python benchmarks/bench_aging.py [--sizes 10000 50000 200000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reports import AGING_BUCKETS, PaymentStatusMatrix, arrears_aging, month_ages  # noqa: E402
+from storage import CLASS_CATEGORIES, MONTHS  # noqa: E402
+
+YEAR = "2025-26"
+AS_OF = "2026-01-15"
+
+
+def make_ledger(n_students, payments_per_student=6, seed=0):
+    """Synthetic year: each student pays, fully or partly, for a random subset of months"""
+    rng = np.random.default_rng(seed)
+    ids = np.array([f"{i:08X}" for i in range(n_students)], dtype=object)
+    classes = rng.choice(CLASS_CATEGORIES, n_students)
+    fees = rng.choice([800, 1000, 1200, 1500], n_students)
+
+    student_idx = np.repeat(np.arange(n_students), payments_per_student)
+    month_idx = rng.integers(0, len(MONTHS), len(student_idx))
+    received = fees[student_idx] - rng.choice([0, 0, 0, 200], len(student_idx))
+    return pd.DataFrame({
+        "ID": ids[student_idx],
+        "Student Name": np.char.add("student ", student_idx.astype(str)).astype(object),
+        "Class Category": classes[student_idx],
+        "Month": np.asarray(MONTHS, dtype=object)[month_idx],
+        "Monthly Fee": fees[student_idx],
+        "Received Amount": received,
+        "Academic Year": YEAR,
+    })
+
+
+def loop_aging(matrix):
+    """Per-student, per-month loop over the same matrix, for checking and comparison"""
+    ages = month_ages(matrix.year, matrix.months, AS_OF)
+    balance = matrix.outstanding
+    rows = []
+    for i in range(matrix.n):
+        buckets = [0.0] * len(AGING_BUCKETS)
+        for j, age in enumerate(ages):
+            if age < 0 or balance[i, j] <= 0:
+                continue
+            k = max(b for b, (_, low) in enumerate(AGING_BUCKETS) if age >= low)
+            buckets[k] += balance[i, j]
+        rows.append(buckets)
+    return np.array(rows)
+
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 200000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    labels = [label for label, _ in AGING_BUCKETS]
+    print(f"{'students':>10} {'loop (s)':>10} {'vectorized (s)':>15} {'speedup':>8}")
+    for n in args.sizes:
+        matrix = PaymentStatusMatrix.from_frame(make_ledger(n))
+        students, _ = arrears_aging(matrix, AS_OF)
+        assert np.allclose(students[labels].to_numpy(), loop_aging(matrix))
+
+        loop = best_of(lambda: loop_aging(matrix), 1)
+        vectorized = best_of(lambda: arrears_aging(matrix, AS_OF), args.repeat)
+        print(f"{n:>10} {loop:>10.3f} {vectorized:>15.3f} {loop / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compare ledger load times: the old pd.read_csv path, the typed CSV path and
+the columnar (Parquet) snapshot, cold and warm.
+
+Cold is a fresh store, i.e. the first load in a new Streamlit process; warm is
+a second load from the same store, served from its in-process cache.
+
+    python benchmarks/bench_load.py [--sizes 10000 100000 500000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import CLASS_CATEGORIES, MONTHS, CsvFeeStore, new_record_key  # noqa: E402
+
+PAGE_COLUMNS = ["Student Name", "Class Category", "Month", "Monthly Fee", "Received Amount"]
+
+
+def make_ledger(n_rows, seed=0):
+    """Synthetic ledger with every stored column filled in"""
+    rng = np.random.default_rng(seed)
+    n_students = max(n_rows // 6, 1)
+    student = rng.integers(0, n_students, n_rows)
+    fees = rng.choice([800, 1000, 1200, 1500], n_students)
+    dates = pd.Timestamp("2024-04-01") + pd.to_timedelta(rng.integers(0, 365, n_rows), unit="D")
+    return pd.DataFrame({
+        "ID": np.char.add("S", student.astype(str)).astype(object),
+        "Student Name": np.char.add("student ", student.astype(str)).astype(object),
+        "Class Category": np.asarray(CLASS_CATEGORIES, dtype=object)[student % len(CLASS_CATEGORIES)],
+        "Class Section": "A",
+        "Month": np.asarray(MONTHS, dtype=object)[rng.integers(0, len(MONTHS), n_rows)],
+        "Monthly Fee": fees[student],
+        "Annual Charges": 0,
+        "Admission Fee": 0,
+        "Received Amount": fees[student] - rng.choice([0, 0, 0, 200], n_rows),
+        "Date": dates.strftime("%Y-%m-%d"),
+        "Signature": "office",
+        "Entry Timestamp": (dates + pd.Timedelta(hours=10)).strftime("%Y-%m-%d %H:%M:%S"),
+        "Record Key": [new_record_key() for _ in range(n_rows)],
+    })
+
+
+def legacy_load(path):
+    """What load_data did before the storage layer: untyped read_csv plus to_datetime"""
+    df = pd.read_csv(path)
+    df['Date'] = pd.to_datetime(df['Date'], format='mixed', dayfirst=True, errors='coerce')
+    df['Entry Timestamp'] = pd.to_datetime(df['Entry Timestamp'], format='mixed', dayfirst=True, errors='coerce')
+    return df
+
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def cold_store(path, columnar):
+    store = CsvFeeStore(path)
+    store.COLUMNAR = columnar
+    return store
+
+
+def warm_store(path, columnar):
+    store = cold_store(path, columnar)
+    store.load()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 500000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if not CsvFeeStore.COLUMNAR:
+        sys.exit("pyarrow is not installed; the columnar snapshot is unavailable")
+
+    header = f"{'rows':>9} {'read_csv':>9} {'typed csv':>10} {'parquet':>9} {'parquet 5 cols':>15} {'warm':>9}"
+    print("cold load times in seconds, best of", args.repeat)
+    print(header)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            path = os.path.join(tmp, f"fees_{n}.csv")
+            make_ledger(n).to_csv(path, index=False)
+            # The first columnar read builds the snapshot
+            built = cold_store(path, True).load()
+            pd.testing.assert_frame_equal(built, cold_store(path, False).load())
+
+            legacy = best_of(lambda: legacy_load(path), args.repeat)
+            typed_csv = best_of(lambda: cold_store(path, False).load(), args.repeat)
+            columnar = best_of(lambda: cold_store(path, True).load(), args.repeat)
+            projected = best_of(lambda: cold_store(path, True).load(PAGE_COLUMNS), args.repeat)
+            store = warm_store(path, True)
+            warm = best_of(store.load, args.repeat)
+            print(f"{n:>9} {legacy:>9.3f} {typed_csv:>10.3f} {columnar:>9.3f} {projected:>15.3f} {warm:>9.5f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Compare the Paid & Unpaid status grid against the old iterrows version.
+
+The grid is now built from the payment status matrix (PaymentStatusMatrix.to_grid),
+which also applies payments FIFO, so the two are checked against each other on the
+amounts received per student and month rather than on Status.
+
+    python benchmarks/bench_status_grid.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reports import PaymentStatusMatrix  # noqa: E402
+from storage import MONTHS  # noqa: E402
+
+CLASSES = ["Nursery", "KGI", "KGII"] + [f"Class {i}" for i in range(1, 10)] + ["Class 10 (Matric)"]
+
+
+def make_ledger(n_students, payments_per_student=6, seed=0):
+    """Synthetic ledger: each student pays for a random subset of months"""
+    rng = np.random.default_rng(seed)
+    ids = np.array([f"{i:08X}" for i in range(n_students)], dtype=object)
+    classes = rng.choice(CLASSES, n_students)
+    fees = rng.choice([800, 1000, 1200, 1500], n_students)
+
+    student_idx = np.repeat(np.arange(n_students), payments_per_student)
+    month_idx = rng.integers(0, len(MONTHS), len(student_idx))
+    received = fees[student_idx] - rng.choice([0, 0, 0, 200], len(student_idx))
+    return pd.DataFrame({
+        "ID": ids[student_idx],
+        "Student Name": np.char.add("student ", student_idx.astype(str)).astype(object),
+        "Class Category": classes[student_idx],
+        "Month": np.asarray(MONTHS, dtype=object)[month_idx],
+        "Monthly Fee": fees[student_idx],
+        "Received Amount": received,
+    })
+
+
+def legacy_status_grid(df):
+    """The original implementation from main_app, kept here for comparison"""
+    df = df.copy()
+    df['Outstanding'] = df['Monthly Fee'] - df['Received Amount']
+    all_students = df[['ID', 'Student Name', 'Class Category']].drop_duplicates()
+    all_combinations = pd.DataFrame([
+        (student['ID'], student['Student Name'], student['Class Category'], month)
+        for _, student in all_students.iterrows()
+        for month in MONTHS
+    ], columns=['ID', 'Student Name', 'Class Category', 'Month'])
+    merged = pd.merge(all_combinations,
+                      df[['ID', 'Month', 'Monthly Fee', 'Received Amount', 'Outstanding']],
+                      on=['ID', 'Month'],
+                      how='left')
+    student_fees = df.groupby('ID')['Monthly Fee'].first().reset_index()
+    merged = pd.merge(merged, student_fees, on='ID', how='left')
+    merged['Status'] = 'Unpaid'
+    merged.loc[merged['Outstanding'] <= 0, 'Status'] = 'Paid'
+    merged.loc[merged['Outstanding'].isna() & (merged['Monthly Fee_y'] > 0), 'Outstanding'] = merged['Monthly Fee_y']
+    return merged
+
+
+def status_grid(df):
+    """The student x month grid the Paid & Unpaid page exports"""
+    return PaymentStatusMatrix.from_frame(df).to_grid()
+
+
+def best_of(func, df, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'students':>10} {'rows':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>8}")
+    for n in args.sizes:
+        df = make_ledger(n)
+        new = status_grid(df).set_index(['ID', 'Month'])['Received Amount']
+        old = legacy_status_grid(df).groupby(['ID', 'Month'])['Received Amount'].sum(min_count=1).dropna()
+        assert (new.loc[old.index].to_numpy() == old.to_numpy()).all()
+        assert new.drop(old.index).eq(0).all()
+
+        legacy = best_of(legacy_status_grid, df, args.repeat)
+        vectorized = best_of(status_grid, df, args.repeat)
+        print(f"{n:>10} {len(df):>10} {legacy:>12.3f} {vectorized:>15.3f} {legacy / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Bulk import of fee records from CSV or Excel files laid out like fees_data.csv.
+
+Files are read and validated in chunks; accepted rows are stored with one
+write per academic year, and every rejected row is reported with its reasons.
+Used by the "Bulk Import" page and from the command line:
+
+    python fee_import.py payments.xlsx --signature "Office"
+"""
+import argparse
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from storage import (
+    CLASS_CATEGORIES, DATE_FORMATS, FEE_COLUMNS, KEY_COLUMN, MONEY_COLUMNS, MONTHS, YEAR_COLUMN,
+    assign_academic_years, generate_student_ids, get_store, initialize_storage, open_academic_years,
+    parse_dates
+)
+
+CHUNK_ROWS = 5000
+# A file without these columns is refused outright
+REQUIRED_COLUMNS = ["Student Name", "Class Category", "Month"]
+# Columns added to rejected rows in the report
+ROW_COLUMN = "Row"
+REASON_COLUMN = "Rejection Reason"
+
+
+def read_chunks(source, filename, chunk_rows=CHUNK_ROWS):
+    """Yield the rows of a CSV or Excel file as DataFrames of at most chunk_rows rows.
+
+    The index continues across chunks and counts data rows from 0.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".csv":
+        yield from pd.read_csv(source, dtype=str, chunksize=chunk_rows, skipinitialspace=True)
+    elif ext in (".xlsx", ".xlsm"):
+        yield from read_excel_chunks(source, chunk_rows)
+    else:
+        raise ValueError(f"Unsupported file type '{ext}'; use a .csv or .xlsx file")
+
+
+def read_excel_chunks(source, chunk_rows=CHUNK_ROWS):
+    """Stream the first sheet of a workbook without loading it all into memory"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Reading Excel files needs the openpyxl package") from None
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = ["" if cell is None else str(cell).strip() for cell in next(rows, ())]
+        width = len(header)
+        start, chunk = 0, []
+        for row in rows:
+            chunk.append((tuple(row) + (None,) * width)[:width])
+            if len(chunk) == chunk_rows:
+                yield pd.DataFrame(chunk, columns=header, index=range(start, start + len(chunk)))
+                start, chunk = start + len(chunk), []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header, index=range(start, start + len(chunk)))
+    finally:
+        workbook.close()
+
+
+def clean_text(values):
+    """Strip surrounding whitespace; blanks become missing"""
+    values = values.astype(object).where(values.notna(), None).astype(str).str.strip()
+    return values.mask(values.isin(["", "None", "nan"]))
+
+
+def validate_chunk(chunk, year=None, signature=None, now=None, first_row=2):
+    """Split a chunk of imported rows into (accepted, rejected).
+
+    Accepted rows are in the stored layout, with IDs, dates and academic
+    years filled in. Rejected rows keep their original values plus their
+    row number (first_row for index 0; 2 is the first spreadsheet row after
+    the header) and the reasons they were refused.
+    """
+    chunk = chunk.dropna(how='all')
+    now = now or datetime.now()
+    empty = pd.Series(None, index=chunk.index, dtype=object)
+
+    def column(col):
+        return clean_text(chunk[col]) if col in chunk.columns else empty
+
+    reasons = pd.Series("", index=chunk.index)
+
+    def reject(mask, reason):
+        nonlocal reasons
+        reasons = reasons.where(~mask, reasons + reason + "; ")
+
+    df = pd.DataFrame(index=chunk.index)
+    for col in ["ID", "Student Name", "Class Section", "Signature"]:
+        df[col] = column(col)
+    reject(df["Student Name"].isna(), "missing Student Name")
+
+    df["Class Category"] = column("Class Category")
+    reject(~df["Class Category"].isin(CLASS_CATEGORIES), "unknown Class Category " + df["Class Category"].fillna("(blank)"))
+
+    df["Month"] = column("Month").str.upper()
+    reject(~df["Month"].isin(MONTHS), "unknown Month " + df["Month"].fillna("(blank)"))
+
+    for col in MONEY_COLUMNS:
+        raw = column(col)
+        amounts = pd.to_numeric(raw.str.replace(",", "", regex=False), errors='coerce')
+        reject(raw.notna() & amounts.isna(), f"{col} is not a number")
+        reject(amounts < 0, f"negative {col}")
+        df[col] = amounts.fillna(0).round()
+
+    for col, formats in DATE_FORMATS.items():
+        raw = column(col)
+        parsed = parse_dates(raw, formats)
+        reject(raw.notna() & parsed.isna(), f"unreadable {col}")
+        df[col] = parsed
+    df["Entry Timestamp"] = df["Entry Timestamp"].fillna(pd.Timestamp(now))
+
+    df["Signature"] = df["Signature"].fillna(signature) if signature else df["Signature"]
+    reject(df["Signature"].isna(), "missing Signature")
+
+    df[YEAR_COLUMN] = year if year else column(YEAR_COLUMN)
+    assign_academic_years(df)
+    reject(~df[YEAR_COLUMN].isin(open_academic_years()), "academic year " + df[YEAR_COLUMN].astype(str) + " is closed")
+
+    ok = reasons == ""
+    accepted = df[ok].copy()
+    # IDs for students in the batch, hashing each name/class pair once
+    missing_id = accepted["ID"].isna()
+    if missing_id.any():
+        accepted.loc[missing_id, "ID"] = generate_student_ids(
+            accepted.loc[missing_id, "Student Name"], accepted.loc[missing_id, "Class Category"]
+        )
+    for col in MONEY_COLUMNS:
+        accepted[col] = accepted[col].astype(int)
+    accepted["Date"] = accepted["Date"].dt.strftime(DATE_FORMATS["Date"][0])
+    accepted["Entry Timestamp"] = accepted["Entry Timestamp"].dt.strftime(DATE_FORMATS["Entry Timestamp"][0])
+    accepted = accepted.reindex(columns=[col for col in FEE_COLUMNS if col != KEY_COLUMN])
+
+    rejected = chunk[~ok].copy()
+    rejected.insert(0, ROW_COLUMN, rejected.index + first_row)
+    rejected[REASON_COLUMN] = reasons[~ok].str.rstrip("; ")
+    return accepted, rejected
+
+
+def import_fees(source, filename, year=None, signature=None, chunk_rows=CHUNK_ROWS, dry_run=False, backend=None):
+    """Validate a CSV/Excel file of fee records and store the valid rows.
+
+    Returns (accepted, rejected) frames. Nothing is stored until the whole
+    file has been read; the accepted rows are then written with one write
+    per academic year. With dry_run nothing is stored at all.
+    """
+    now = datetime.now()
+    accepted, rejected = [], []
+    for chunk in read_chunks(source, filename, chunk_rows):
+        if not accepted:
+            missing = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+            if missing:
+                raise ValueError(f"{filename} is missing the column(s): {', '.join(missing)}")
+        ok, bad = validate_chunk(chunk, year=year, signature=signature, now=now)
+        accepted.append(ok)
+        rejected.append(bad)
+
+    accepted = pd.concat(accepted) if accepted else pd.DataFrame(columns=FEE_COLUMNS)
+    rejected = pd.concat(rejected) if rejected else pd.DataFrame(columns=[ROW_COLUMN, REASON_COLUMN])
+    if not dry_run:
+        store_rows(accepted, backend)
+    return accepted, rejected
+
+
+def store_rows(accepted, backend=None):
+    """Store validated rows with one write per academic year"""
+    for fee_year, rows in accepted.groupby(YEAR_COLUMN, sort=False):
+        get_store(fee_year, backend).append_many(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import fee records from a CSV or Excel file")
+    parser.add_argument("file", help="CSV or .xlsx file with the fees_data.csv columns")
+    parser.add_argument("--year", help="Academic year for every row (default: from each row's payment date)")
+    parser.add_argument("--signature", help="Received By for rows without a Signature")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows validated at a time")
+    parser.add_argument("--dry-run", action="store_true", help="Only validate; store nothing")
+    parser.add_argument("--rejects", help="Where to write the rejected rows (default: <file>.rejected.csv)")
+    args = parser.parse_args(argv)
+
+    initialize_storage()
+    try:
+        with open(args.file, 'rb') as f:
+            accepted, rejected = import_fees(
+                f, args.file, year=args.year, signature=args.signature,
+                chunk_rows=args.chunk_rows, dry_run=args.dry_run
+            )
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    verb = "Validated" if args.dry_run else "Imported"
+    print(f"{verb} {len(accepted)} fee records, rejected {len(rejected)}")
+    if len(rejected):
+        rejects_path = args.rejects or os.path.splitext(args.file)[0] + ".rejected.csv"
+        rejected.to_csv(rejects_path, index=False)
+        print(f"Rejected rows and reasons written to {rejects_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Fee schedule: what each class is charged per fee head in each academic year.
+
+Entries are kept in fee_schedule.csv, one row per class, academic year, fee
+head and effective date, and edited on the admin "Fee Schedule" page.
+
+A Monthly Fee change during the year is a second entry with a later
+Effective From; it applies to the months starting on or after that date. A
+blank Effective From means the whole year.
+
+Annual Charges and Admission Fee are charged once in the year, in the month
+their Effective From falls in (the first month if blank); a later entry for
+the same class and head replaces an earlier one. Every student of the class
+owes them unless an amount for that head is recorded for the student in the
+year, in which case the recorded amount is owed instead.
+
+Reports use the schedule for the monthly fee a student owes in months with
+no fee record. Classes without a schedule for the year fall back to the
+student's first recorded fee.
+"""
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from storage import (
+    CLASS_CATEGORIES, MONTHS, YEAR_COLUMN, file_signature, write_csv_atomically
+)
+
+SCHEDULE_FILE = "fee_schedule.csv"
+FEE_HEADS = ["Monthly Fee", "Annual Charges", "Admission Fee"]
+# Heads charged once a year rather than every month
+CHARGE_HEADS = FEE_HEADS[1:]
+SCHEDULE_COLUMNS = ["Class Category", YEAR_COLUMN, "Fee Head", "Amount", "Effective From"]
+
+
+def month_starts(year, months=MONTHS):
+    """First day of each month of an academic year such as 2025-26"""
+    start = int(year[:4])
+    numbers = [(MONTHS.index(month) + 3) % 12 + 1 for month in months]
+    return pd.to_datetime([f"{start + (number < 4)}-{number:02d}-01" for number in numbers]).to_numpy()
+
+
+def clean_schedule(df):
+    """Schedule entries with the expected columns and types, invalid rows dropped"""
+    df = df.reindex(columns=SCHEDULE_COLUMNS).copy()
+    for col in ["Class Category", YEAR_COLUMN, "Fee Head"]:
+        df[col] = df[col].astype(object).where(df[col].notna(), None)
+        df[col] = df[col].map(lambda value: str(value).strip() if value is not None else None)
+    df["Amount"] = pd.to_numeric(df["Amount"], errors='coerce')
+    df["Effective From"] = pd.to_datetime(df["Effective From"], errors='coerce')
+    valid = (
+        df["Class Category"].notna() & df[YEAR_COLUMN].str.fullmatch(r"\d{4}-\d{2}").fillna(False)
+        & df["Fee Head"].isin(FEE_HEADS) & (df["Amount"] >= 0)
+    )
+    return df[valid].sort_values(["Class Category", YEAR_COLUMN, "Fee Head", "Effective From"],
+                                 na_position='first', kind='stable').reset_index(drop=True)
+
+
+def _lookup(scheduled, table, classes, fill):
+    """Rows of a per-class table for each class given, fill for classes without one"""
+    lookup = np.vstack([table, np.full((1, table.shape[1]), fill)])
+    codes = pd.Categorical(pd.Series(classes, dtype=object), categories=scheduled).codes
+    return lookup[codes]  # code -1 (no schedule) picks the fill row
+
+
+class FeeSchedule:
+    """Fee schedule entries with vectorized lookups of the fees due"""
+
+    def __init__(self, entries=None):
+        self.entries = clean_schedule(entries if entries is not None else pd.DataFrame(columns=SCHEDULE_COLUMNS))
+        self._tables = {}  # (fee head, year, months) -> (classes, classes x months array of amounts)
+
+    def _year_entries(self, year, fee_head):
+        return self.entries[(self.entries[YEAR_COLUMN] == year) & (self.entries["Fee Head"] == fee_head)]
+
+    def monthly_table(self, year, months=MONTHS):
+        """Classes with a scheduled monthly fee in the year, and that fee for each month.
+
+        Returns (classes, array of shape len(classes) x len(months)); months
+        before a class's first effective date hold NaN.
+        """
+        cache_key = ("Monthly Fee", year, tuple(months))
+        if cache_key not in self._tables:
+            starts = month_starts(year, months) if year else None
+            entries = self._year_entries(year, "Monthly Fee")
+            classes, rows = [], []
+            for category, class_entries in entries.groupby("Class Category", sort=False):
+                due = np.full(len(months), np.nan)
+                # Entries are sorted by date, so later ones overwrite the months they cover
+                for effective, amount in zip(class_entries["Effective From"], class_entries["Amount"]):
+                    due[slice(None) if pd.isna(effective) else starts >= effective.to_datetime64()] = amount
+                classes.append(category)
+                rows.append(due)
+            self._tables[cache_key] = (classes, np.array(rows).reshape(len(rows), len(months)))
+        return self._tables[cache_key]
+
+    def monthly_fees(self, classes, year, months=MONTHS):
+        """Scheduled monthly fee for each class given (one row each) in each month, NaN if none"""
+        return _lookup(*self.monthly_table(year, months), classes, np.nan)
+
+    def charge_table(self, fee_head, year, months=MONTHS):
+        """Classes with a scheduled one-off charge (see CHARGE_HEADS) in the year, and when it is due.
+
+        Returns (classes, array of shape len(classes) x len(months)) holding
+        the amount in the month it falls due and 0 elsewhere.
+        """
+        cache_key = (fee_head, year, tuple(months))
+        if cache_key not in self._tables:
+            starts = month_starts(year, months) if year else None
+            # Entries are sorted by date; the last one of each class is the one that applies
+            entries = self._year_entries(year, fee_head).groupby("Class Category", sort=False).tail(1)
+            table = np.zeros((len(entries), len(months)))
+            if len(entries):
+                effective = entries["Effective From"].to_numpy(dtype='datetime64[ns]')
+                due_month = np.where(
+                    np.isnat(effective), 0,
+                    np.clip(np.searchsorted(starts, effective, side='right') - 1, 0, len(months) - 1)
+                )
+                table[np.arange(len(entries)), due_month] = entries["Amount"].to_numpy()
+            self._tables[cache_key] = (list(entries["Class Category"]), table)
+        return self._tables[cache_key]
+
+    def charges(self, classes, fee_head, year, months=MONTHS):
+        """Scheduled one-off charge for each class given (one row each) in the month it is due, else 0"""
+        return _lookup(*self.charge_table(fee_head, year, months), classes, 0.0)
+
+
+def suggest_schedule(df, year):
+    """Monthly Fee entries for a year taken from the most common recorded fee of each class"""
+    fees = df[pd.to_numeric(df["Monthly Fee"], errors='coerce') > 0]
+    common = fees.groupby("Class Category", observed=True)["Monthly Fee"].agg(lambda values: values.mode().iloc[0])
+    return pd.DataFrame({
+        "Class Category": [category for category in CLASS_CATEGORIES if category in common.index],
+        YEAR_COLUMN: year,
+        "Fee Head": "Monthly Fee",
+        "Amount": [common[category] for category in CLASS_CATEGORIES if category in common.index],
+        "Effective From": pd.NaT,
+    })
+
+
+def load_schedule(path=SCHEDULE_FILE):
+    """Read the fee schedule file (an empty schedule if there is none)"""
+    if not os.path.exists(path):
+        return FeeSchedule()
+    return FeeSchedule(pd.read_csv(path, dtype={"Class Category": str, YEAR_COLUMN: str, "Fee Head": str}))
+
+
+def save_schedule(df, path=SCHEDULE_FILE):
+    """Replace the fee schedule with the given entries and return the cleaned schedule"""
+    schedule = FeeSchedule(df)
+    stored = schedule.entries.copy()
+    stored["Effective From"] = stored["Effective From"].dt.strftime("%Y-%m-%d")
+    write_csv_atomically(stored, path)
+    return schedule
+
+
+_current = None  # (file signature, FeeSchedule)
+_current_lock = threading.Lock()
+
+
+def current_schedule(path=SCHEDULE_FILE):
+    """The fee schedule shared by all sessions, read again only when the file changes"""
+    global _current
+    signature = (path, file_signature(path))
+    with _current_lock:
+        if _current is None or _current[0] != signature:
+            _current = (signature, load_schedule(path))
+        return _current[1]
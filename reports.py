@@ -0,0 +1,673 @@
+"""Report calculations used by the fee pages.
+
+Nothing in here touches Streamlit, so the functions can be reused and
+benchmarked on their own (see benchmarks/).
+"""
+import sys
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+import numpy as np
+import pandas as pd
+
+from fee_schedule import CHARGE_HEADS, current_schedule, month_starts
+from storage import MONTHS, YEAR_COLUMN, register_view
+
+# Memory the cached Student Yearly Reports may take, shared by all sessions
+STUDENT_REPORT_CACHE_BYTES = 32 * 1024 * 1024
+
+
+def filter_records(df, search=None, sort_by=None, ascending=True):
+    """Ledger rows whose student name or ID contains search, optionally sorted"""
+    if search:
+        needle = search.strip().lower()
+        matches = (
+            df['Student Name'].astype(str).str.lower().str.contains(needle, regex=False)
+            | df['ID'].astype(str).str.lower().str.contains(needle, regex=False)
+        )
+        df = df[matches]
+    if sort_by:
+        df = df.sort_values(sort_by, ascending=ascending, kind='stable')
+    return df
+
+
+def page_count(n_rows, page_size):
+    """Number of pages needed for n_rows (at least one)"""
+    return max(1, -(-n_rows // page_size))
+
+
+def page_of(df, page, page_size):
+    """Rows of the given 1-based page, clamped to the valid range, and that page number"""
+    page = min(max(1, int(page)), page_count(len(df), page_size))
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size], page
+
+
+def _month_codes(values, months):
+    """Position of each month name in the academic year, -1 if it is not one"""
+    return pd.Categorical(values, categories=months).codes.astype(np.int64)
+
+
+def _money(values):
+    """Amounts as float64 with missing values counted as zero"""
+    return np.nan_to_num(pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64))
+
+
+def _charge_amounts(df):
+    """Annual charges and admission fee of each row, one column per CHARGE_HEADS entry"""
+    return np.column_stack([
+        _money(df[col]) if col in df.columns else np.zeros(len(df)) for col in CHARGE_HEADS
+    ]).reshape(len(df), len(CHARGE_HEADS))
+
+
+def allocate_payments(dues, received):
+    """Apply each row's received total to its dues oldest first (FIFO).
+
+    dues is a students x periods array in the order they fell due and
+    received the total each student paid. Returns the amount of each due
+    that is covered; whatever is left of a payment after the last due is
+    the student's credit.
+    """
+    dues = np.clip(dues, 0, None)
+    # A due is covered as far as the payments reach past everything owed before it
+    covered_to = np.minimum(np.cumsum(dues, axis=1), np.clip(received, 0, None)[:, None])
+    return np.diff(covered_to, axis=1, prepend=0)
+
+
+class FeeAllocation:
+    """Received amounts applied to each student's oldest dues first.
+
+    Rows match PaymentStatusMatrix.students(), columns its months. due is
+    the monthly fee plus any other charges of each month, received what was
+    recorded against it, allocated the part of the due covered by the
+    student's payments applied FIFO across the year, and running_balance
+    what the student owed (negative: had in credit) at the end of each month.
+    """
+
+    def __init__(self, due, received):
+        self.due = due
+        self.received = received
+        total_received = received.sum(axis=1)
+        self.allocated = allocate_payments(due, total_received)
+        self.outstanding = due.clip(min=0) - self.allocated
+        self.credit = total_received - self.allocated.sum(axis=1)
+        self.running_balance = np.cumsum(due, axis=1) - np.cumsum(received, axis=1)
+
+
+class PaymentStatusMatrix:
+    """Students x months fees and payments held in NumPy arrays.
+
+    Row i is one student ID (name and class taken from its first record),
+    column j is months[j]. billed and paid are the recorded monthly fees and
+    received amounts per cell, records the number of fee rows behind each
+    cell, standard_fee each student's first recorded monthly fee and charges
+    the annual charges and admission fee owed per cell. Cells without
+    records owe the monthly fee from the fee schedule (see scheduled_fee),
+    and students without a recorded annual charge or admission fee owe the
+    scheduled one (see scheduled_charges); both are looked up when asked
+    for, so schedule changes apply at once.
+    Balances and paid/unpaid status come from allocation(), which applies
+    each student's payments to their oldest dues and is cached until the
+    matrix or the schedule changes. Rows are appended in place as new
+    fee records arrive and amounts are subtracted again when records are
+    edited or deleted, so the store never rebuilds it for a single change.
+    Students whose records have all been deleted are hidden from the
+    public arrays and tables.
+    """
+
+    def __init__(self, months=MONTHS, capacity=64):
+        self.months = list(months)
+        self.year = None  # academic year of the records
+        self._used = 0
+        self._row = {}  # ID -> row
+        self._ids, self._names, self._classes = [], [], []
+        self._allocation = None  # (schedule, FeeAllocation) until the next change
+        self._alloc(max(capacity, 1))
+
+    def _alloc(self, capacity):
+        n_months = len(self.months)
+        grown = {
+            '_billed': np.zeros((capacity, n_months)),
+            '_paid': np.zeros((capacity, n_months)),
+            '_charges': np.zeros((capacity, n_months)),
+            '_head_charges': np.zeros((capacity, len(CHARGE_HEADS))),  # recorded per student and head
+            '_records': np.zeros((capacity, n_months), dtype=np.int32),
+            '_standard_fee': np.full(capacity, np.nan),
+            '_ledger_rows': np.zeros(capacity, dtype=np.int64),
+        }
+        for name, array in grown.items():
+            if hasattr(self, name):
+                array[:self._used] = getattr(self, name)[:self._used]
+            setattr(self, name, array)
+
+    @classmethod
+    def from_frame(cls, df, months=MONTHS):
+        """Build the matrix from the whole ledger in one vectorized pass"""
+        matrix = cls(months)
+        if df.empty or 'ID' not in df.columns:
+            return matrix
+
+        if YEAR_COLUMN in df.columns and df[YEAR_COLUMN].notna().any():
+            matrix.year = df[YEAR_COLUMN].dropna().iloc[0]
+        codes, ids = pd.factorize(df['ID'], use_na_sentinel=False)
+        n, n_months = len(ids), len(matrix.months)
+        _, first = np.unique(codes, return_index=True)
+        matrix._alloc(n)
+        matrix._used = n
+        matrix._ids = list(ids)
+        matrix._names = list(df['Student Name'].to_numpy()[first])
+        matrix._classes = list(df['Class Category'].to_numpy()[first])
+        matrix._row = {student_id: i for i, student_id in enumerate(matrix._ids)}
+
+        month_codes = _month_codes(df['Month'], matrix.months)
+        valid = month_codes >= 0
+        cells = codes[valid] * n_months + month_codes[valid]
+        size = n * n_months
+        matrix._billed[:n] = np.bincount(cells, _money(df['Monthly Fee'])[valid], size).reshape(n, n_months)
+        matrix._paid[:n] = np.bincount(cells, _money(df['Received Amount'])[valid], size).reshape(n, n_months)
+        charges = _charge_amounts(df)
+        matrix._charges[:n] = np.bincount(cells, charges.sum(axis=1)[valid], size).reshape(n, n_months)
+        for k in range(len(CHARGE_HEADS)):
+            matrix._head_charges[:n, k] = np.bincount(codes, charges[:, k], n)
+        matrix._records[:n] = np.bincount(cells, minlength=size).reshape(n, n_months)
+        matrix._ledger_rows[:n] = np.bincount(codes, minlength=n)
+        matrix._standard_fee[:n] = pd.to_numeric(df['Monthly Fee'], errors='coerce').groupby(codes).first().reindex(range(n)).to_numpy(dtype=np.float64)
+        return matrix
+
+    def _student_row(self, student_id, name, class_category):
+        row = self._row.get(student_id)
+        if row is None:
+            if self._used == len(self._standard_fee):
+                self._alloc(2 * self._used)
+            row = self._used
+            self._used += 1
+            self._row[student_id] = row
+            self._ids.append(student_id)
+            self._names.append(name)
+            self._classes.append(class_category)
+        return row
+
+    def apply_insert(self, rows):
+        """Add newly saved fee rows to the matrix in place"""
+        self._allocation = None
+        if self.year is None and YEAR_COLUMN in rows.columns and rows[YEAR_COLUMN].notna().any():
+            self.year = rows[YEAR_COLUMN].dropna().iloc[0]
+        student_rows = np.array([
+            self._student_row(student_id, name, class_category)
+            for student_id, name, class_category
+            in zip(rows['ID'], rows['Student Name'], rows['Class Category'])
+        ], dtype=np.int64)
+        np.add.at(self._ledger_rows, student_rows, 1)
+        charges = _charge_amounts(rows)
+        np.add.at(self._head_charges, student_rows, charges)
+        fees = pd.to_numeric(rows['Monthly Fee'], errors='coerce').to_numpy(dtype=np.float64)
+        for row, fee in zip(student_rows, fees):
+            if np.isnan(self._standard_fee[row]):
+                self._standard_fee[row] = fee
+
+        month_codes = _month_codes(rows['Month'], self.months)
+        valid = month_codes >= 0
+        r, c = student_rows[valid], month_codes[valid]
+        np.add.at(self._billed, (r, c), _money(rows['Monthly Fee'])[valid])
+        np.add.at(self._paid, (r, c), _money(rows['Received Amount'])[valid])
+        np.add.at(self._charges, (r, c), charges.sum(axis=1)[valid])
+        np.add.at(self._records, (r, c), 1)
+
+    def apply_delete(self, rows):
+        """Take removed (or pre-edit) fee rows back out of the matrix in place"""
+        self._allocation = None
+        student_rows = np.array([self._row[student_id] for student_id in rows['ID']], dtype=np.int64)
+        np.add.at(self._ledger_rows, student_rows, -1)
+        charges = _charge_amounts(rows)
+        np.add.at(self._head_charges, student_rows, -charges)
+
+        month_codes = _month_codes(rows['Month'], self.months)
+        valid = month_codes >= 0
+        r, c = student_rows[valid], month_codes[valid]
+        np.add.at(self._billed, (r, c), -_money(rows['Monthly Fee'])[valid])
+        np.add.at(self._paid, (r, c), -_money(rows['Received Amount'])[valid])
+        np.add.at(self._charges, (r, c), -charges.sum(axis=1)[valid])
+        np.add.at(self._records, (r, c), -1)
+
+    @property
+    def _visible(self):
+        """Rows of students that still have at least one ledger record"""
+        active = self._ledger_rows[:self._used] > 0
+        return slice(0, self._used) if active.all() else np.flatnonzero(active)
+
+    @property
+    def n(self):
+        """Number of students in the matrix"""
+        return int((self._ledger_rows[:self._used] > 0).sum())
+
+    @property
+    def billed(self):
+        return self._billed[self._visible]
+
+    @property
+    def paid(self):
+        return self._paid[self._visible]
+
+    @property
+    def charges(self):
+        """Annual charges and admission fee owed per cell: as recorded, plus any scheduled ones"""
+        return self._charges[self._visible] + self.scheduled_charges
+
+    @property
+    def scheduled_charges(self):
+        """Scheduled annual charges and admission fee per cell, for students with none of that head recorded"""
+        visible = self._visible
+        classes = np.asarray(self._classes, dtype=object)[visible]
+        recorded = self._head_charges[visible] > 0
+        due = np.zeros((len(classes), len(self.months)))
+        for k, head in enumerate(CHARGE_HEADS):
+            scheduled = current_schedule().charges(classes, head, self.year, self.months)
+            due += np.where(recorded[:, k, None], 0, scheduled)
+        return due
+
+    @property
+    def records(self):
+        return self._records[self._visible]
+
+    @property
+    def standard_fee(self):
+        return self._standard_fee[self._visible]
+
+    @property
+    def scheduled_fee(self):
+        """Monthly fee due per cell from the fee schedule, else the student's standard fee"""
+        classes = np.asarray(self._classes, dtype=object)[self._visible]
+        due = current_schedule().monthly_fees(classes, self.year, self.months)
+        return np.where(np.isnan(due), np.nan_to_num(self.standard_fee)[:, None], due)
+
+    @property
+    def expected(self):
+        """Amount due per cell: the recorded fee, else the scheduled one"""
+        return np.where(self.records > 0, self.billed, self.scheduled_fee)
+
+    def allocation(self):
+        """Payments applied FIFO to every student's dues, computed once per change"""
+        schedule = current_schedule()
+        cached = self._allocation
+        if cached is None or cached[0] is not schedule:
+            cached = (schedule, FeeAllocation(self.expected + self.charges, self.paid))
+            self._allocation = cached
+        return cached[1]
+
+    @property
+    def outstanding(self):
+        """Part of each month's dues not covered by the student's payments"""
+        return self.allocation().outstanding
+
+    def students(self):
+        """ID, Student Name and Class Category for each row"""
+        visible = self._visible
+        return pd.DataFrame({
+            'ID': np.asarray(self._ids, dtype=object)[visible],
+            'Student Name': np.asarray(self._names, dtype=object)[visible],
+            'Class Category': np.asarray(self._classes, dtype=object)[visible],
+        })
+
+    def month_frame(self, month):
+        """Per-student status for one month, as shown on the Paid & Unpaid tabs"""
+        j = self.months.index(month)
+        frame = self.students()
+        outstanding = self.outstanding[:, j]
+        frame['Monthly Fee'] = self.expected[:, j]
+        frame['Other Charges'] = self.charges[:, j]
+        frame['Amount Paid'] = self.paid[:, j]
+        frame['Balance Due'] = outstanding
+        frame['Status'] = np.where(outstanding > 0, 'Unpaid', 'Paid')
+        return frame
+
+    def to_grid(self):
+        """Long student x month table: Expected Fee, Other Charges, Received Amount, Outstanding,
+        Running Balance and Status for every student and month"""
+        n_months, n = len(self.months), self.n
+        grid = self.students().loc[np.repeat(np.arange(n), n_months)].reset_index(drop=True)
+        grid['Month'] = np.tile(np.asarray(self.months, dtype=object), n)
+        grid['Expected Fee'] = self.expected.ravel()
+        grid['Other Charges'] = self.charges.ravel()
+        grid['Received Amount'] = self.paid.ravel()
+        grid['Outstanding'] = self.outstanding.ravel()
+        grid['Running Balance'] = self.allocation().running_balance.ravel()
+        grid['Status'] = np.where(grid['Outstanding'] > 0, 'Unpaid', 'Paid')
+        return grid
+
+    def student_months(self, student_id):
+        """One student's months from allocation(): Monthly Fee due, Other Charges, Received Amount,
+        Balance Due, Running Balance and Status, or None if the student has no records"""
+        row = self._row.get(student_id)
+        if row is None or self._ledger_rows[row] <= 0:
+            return None
+        i = int((self._ledger_rows[:row] > 0).sum())  # position among the visible rows
+        allocation = self.allocation()
+        frame = pd.DataFrame({'Month': self.months})
+        frame['Monthly Fee'] = self.expected[i]
+        frame['Other Charges'] = self.charges[i]
+        frame['Received Amount'] = self.paid[i]
+        frame['Balance Due'] = allocation.outstanding[i]
+        frame['Running Balance'] = allocation.running_balance[i]
+        frame['Status'] = np.where(frame['Balance Due'] > 0, 'Unpaid', 'Paid')
+        return frame
+
+    def student_summary(self):
+        """Unpaid month count, outstanding balance and unused credit per student"""
+        allocation = self.allocation()
+        summary = self.students()
+        summary['Unpaid Months'] = (allocation.outstanding > 0).sum(axis=1)
+        summary['Total Outstanding'] = allocation.outstanding.sum(axis=1)
+        summary['Credit'] = allocation.credit
+        return summary
+
+
+register_view("payment_status", PaymentStatusMatrix.from_frame)
+
+
+# Arrears aging buckets: (label, lowest age in months). A month's age is the
+# number of whole months since it started; the month in progress is Current.
+AGING_BUCKETS = [('Current', 0), ('1-2 Months', 1), ('3-5 Months', 3), ('6+ Months', 6)]
+
+
+def month_ages(year, months=MONTHS, on=None):
+    """Age in months of each month of an academic year on a date (today by default).
+
+    Months that have not started yet get a negative age. Without a year every
+    month is taken as due, the last one being Current.
+    """
+    if year is None:
+        return np.arange(len(months) - 1, -1, -1)
+    on = np.datetime64(pd.Timestamp(on) if on is not None else pd.Timestamp.now(), 'M')
+    return (on - month_starts(year, months).astype('datetime64[M]')).astype(np.int64)
+
+
+def aging_buckets(outstanding, ages):
+    """Sum a students x months array of outstanding amounts into aging buckets.
+
+    ages gives the age of each month column; columns not yet due are left
+    out. Returns a students x len(AGING_BUCKETS) array.
+    """
+    edges = np.array([low for _, low in AGING_BUCKETS])
+    bucket = np.searchsorted(edges, ages, side='right') - 1  # -1 for months not yet due
+    # Every column falls in one bucket, so bucketing is a single product with a months x buckets 0/1 matrix
+    return outstanding @ (bucket[:, None] == np.arange(len(edges))).astype(outstanding.dtype)
+
+
+def arrears_aging(matrix, on=None):
+    """Outstanding balances by age for every student and every class.
+
+    Returns (students, classes) frames with one column per aging bucket and a
+    Total Outstanding column, aged as of the given date (today by default).
+    Each student's payments are first applied to their oldest dues (see
+    PaymentStatusMatrix.allocation), so what is left is the newest debt.
+    """
+    labels = [label for label, _ in AGING_BUCKETS]
+    outstanding = matrix.outstanding
+    buckets = aging_buckets(outstanding, month_ages(matrix.year, matrix.months, on))
+
+    students = matrix.students()
+    students[labels] = buckets
+    students['Total Outstanding'] = buckets.sum(axis=1)
+
+    class_codes, class_names = pd.factorize(students['Class Category'], sort=True)
+    n_classes = len(class_names)
+    class_buckets = np.column_stack([
+        np.bincount(class_codes, buckets[:, k], n_classes) for k in range(len(labels))
+    ]).reshape(n_classes, len(labels))
+    classes = pd.DataFrame(class_buckets, columns=labels)
+    classes.insert(0, 'Class Category', class_names)
+    classes.insert(1, 'Students in Arrears', np.bincount(class_codes, students['Total Outstanding'] > 0, n_classes).astype(int))
+    classes['Total Outstanding'] = class_buckets.sum(axis=1)
+    return students, classes
+
+
+def _bump(counter, key, delta):
+    """Add delta to counter[key], dropping the key once it reaches zero"""
+    count = counter[key] + delta
+    if count:
+        counter[key] = count
+    else:
+        del counter[key]
+
+
+def _labels(values):
+    """Column values as plain strings, with blanks for missing ones"""
+    return pd.Series(values).astype(object).fillna('').astype(str).to_numpy()
+
+
+class CollectionTotals:
+    """Fee collection per class and month, kept up to date on every write.
+
+    cells maps (Class Category, Month) to [received, expected, records],
+    expected being everything billed on those records (monthly fee, annual
+    charges and admission fee). Payers per cell and the students of each
+    class are kept as per-student counters, so that edited or deleted rows
+    can be taken back out exactly. Registered as the persisted
+    "collection_totals" view: the store saves it next to the ledger after
+    each write, and a new process loads it from there instead of scanning
+    the fee rows.
+    """
+
+    def __init__(self):
+        self.cells = {}
+        self._payers = defaultdict(Counter)  # (class, month) -> {student ID: rows with a payment}
+        self._students = defaultdict(Counter)  # class -> {student name: rows}
+        self._unbilled = defaultdict(Counter)  # class -> {student name: rows without a monthly fee}
+
+    @classmethod
+    def from_frame(cls, df):
+        totals = cls()
+        totals.apply_insert(df)
+        return totals
+
+    def apply_insert(self, rows):
+        self._apply(rows, 1)
+
+    def apply_delete(self, rows):
+        self._apply(rows, -1)
+
+    def _apply(self, rows, sign):
+        if rows.empty or 'Class Category' not in rows.columns:
+            return
+        received = _money(rows['Received Amount'])
+        monthly = _money(rows['Monthly Fee'])
+        expected = monthly + _money(rows['Annual Charges']) + _money(rows['Admission Fee'])
+        # A plain loop: cheap for the handful of rows a write brings, and a
+        # full build does no worse than a groupby per counter
+        for category, month, student_id, name, paid, billed, fee in zip(
+            _labels(rows['Class Category']), _labels(rows['Month']), _labels(rows['ID']),
+            _labels(rows['Student Name']), received.tolist(), expected.tolist(), monthly.tolist()
+        ):
+            cell = self.cells.setdefault((category, month), [0.0, 0.0, 0])
+            cell[0] += sign * paid
+            cell[1] += sign * billed
+            cell[2] += sign
+            if cell[2] == 0:
+                del self.cells[category, month]
+            if paid > 0:
+                _bump(self._payers[category, month], student_id, sign)
+            _bump(self._students[category], name, sign)
+            if fee == 0:
+                _bump(self._unbilled[category], name, sign)
+
+    @classmethod
+    def combine(cls, parts):
+        """Totals over several ledgers (e.g. academic years), as if built from all their rows"""
+        totals = cls()
+        for part in parts:
+            for key, values in part.cells.items():
+                cell = totals.cells.setdefault(key, [0.0, 0.0, 0])
+                for i, value in enumerate(values):
+                    cell[i] += value
+            for target, source in [(totals._payers, part._payers), (totals._students, part._students),
+                                   (totals._unbilled, part._unbilled)]:
+                for key, counter in source.items():
+                    target[key].update(counter)
+        return totals
+
+    def class_summary(self, class_category):
+        """Students, total received and students without a monthly fee in one class"""
+        return {
+            'Students': len(self._students.get(class_category, ())),
+            'Received': sum(cell[0] for (category, _), cell in self.cells.items() if category == class_category),
+            'Unbilled Students': len(self._unbilled.get(class_category, ())),
+        }
+
+    def monthly(self, class_category):
+        """Expected, Received, Payers and Records per month of one class, in academic order"""
+        months = [month for category, month in self.cells if category == class_category]
+        months = [month for month in MONTHS if month in months] + sorted(set(months) - set(MONTHS))
+        cells = [self.cells[class_category, month] for month in months]
+        return pd.DataFrame({
+            'Expected': [cell[1] for cell in cells],
+            'Received': [cell[0] for cell in cells],
+            'Payers': [len(self._payers.get((class_category, month), ())) for month in months],
+            'Records': [cell[2] for cell in cells],
+        }, index=pd.Index(months, name='Month'))
+
+    def to_json(self):
+        return {
+            'cells': [[category, month, *cell] for (category, month), cell in self.cells.items()],
+            'payers': [[category, month, dict(counter)] for (category, month), counter in self._payers.items() if counter],
+            'students': {category: dict(counter) for category, counter in self._students.items() if counter},
+            'unbilled': {category: dict(counter) for category, counter in self._unbilled.items() if counter},
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        totals = cls()
+        totals.cells = {(category, month): [received, expected, records]
+                        for category, month, received, expected, records in data['cells']}
+        for category, month, counter in data['payers']:
+            totals._payers[category, month].update(counter)
+        for target, source in [(totals._students, data['students']), (totals._unbilled, data['unbilled'])]:
+            for category, counter in source.items():
+                target[category].update(counter)
+        return totals
+
+
+register_view("collection_totals", CollectionTotals.from_frame, restore=CollectionTotals.from_json)
+
+
+class StudentDirectory:
+    """Class -> student name -> ledger row ids, kept in step with writes.
+
+    Backs the Student Yearly Report selectors: classes() and students() are
+    sorted once and kept until a student joins or leaves, and rows() gives
+    the row ids (index labels of load()) of one student's records, so
+    picking a student does not scan the ledger.
+    """
+
+    def __init__(self, df):
+        self._rows = {}  # class -> {student name: set of row ids}
+        self._sorted = {}  # class -> sorted student names
+        self._classes = None  # sorted classes
+        named = df[df['Class Category'].notna() & df['Student Name'].notna()]
+        groups = named[['Class Category', 'Student Name']].astype(object).groupby(
+            ['Class Category', 'Student Name'], sort=False
+        ).indices
+        for (category, name), positions in groups.items():
+            self._rows.setdefault(category, {})[name] = set(named.index[positions])
+
+    def apply_insert(self, rows):
+        for row_id, category, name in zip(rows.index, rows['Class Category'], rows['Student Name']):
+            if pd.isna(category) or pd.isna(name):
+                continue
+            if category not in self._rows:
+                self._classes = None
+            students = self._rows.setdefault(category, {})
+            if name not in students:
+                self._sorted.pop(category, None)
+            students.setdefault(name, set()).add(row_id)
+
+    def apply_delete(self, rows):
+        for row_id, category, name in zip(rows.index, rows['Class Category'], rows['Student Name']):
+            row_ids = self._rows.get(category, {}).get(name)
+            if row_ids is None:
+                continue
+            row_ids.discard(row_id)
+            if not row_ids:
+                del self._rows[category][name]
+                self._sorted.pop(category, None)
+                if not self._rows[category]:
+                    del self._rows[category]
+                    self._classes = None
+
+    def classes(self):
+        """Classes with at least one record, sorted"""
+        if self._classes is None:
+            self._classes = sorted(self._rows)
+        return self._classes
+
+    def students(self, class_category):
+        """Names of the students with records in a class, sorted"""
+        if class_category not in self._sorted:
+            self._sorted[class_category] = sorted(self._rows.get(class_category, ()))
+        return self._sorted[class_category]
+
+    def rows(self, class_category, student_name):
+        """Row ids of one student's records in a class, in ledger order"""
+        return sorted(self._rows.get(class_category, {}).get(student_name, ()))
+
+
+register_view("student_directory", StudentDirectory, columns=["Class Category", "Student Name"])
+
+
+def estimate_bytes(value):
+    """Rough memory footprint of a cached value (frames, bytes and containers of them)"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_bytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache, bounded by the estimated memory of its values"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size), least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """Estimated bytes held"""
+        return self._bytes
+
+    def get_or_build(self, key, build):
+        """The cached value for key, else build() (run outside the lock) and cache it"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        value = build()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """Cache value under key, evicting the least recently used entries to stay in budget"""
+        size = estimate_bytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+
+# Student Yearly Reports keyed by (class, student name, academic year, store version, fee schedule);
+# a write or a schedule change changes the key, so reports of the old data are never served again
+student_reports = LRUCache(STUDENT_REPORT_CACHE_BYTES)
@@ -0,0 +1,1534 @@
+"""Storage backends for the school fee ledger.
+
+The ledger is partitioned by academic year (April to March). get_store(year)
+returns the FeeStore of one year; open years are writable partitions of the
+backend picked with the FEE_STORAGE_BACKEND environment variable ("csv" or
+"sqlite"), closed years are compressed read-only archives in fees_archive/.
+To move the open years into SQLite:
+
+    python storage.py migrate
+
+Closed years are archived on startup; to archive one by hand:
+
+    python storage.py archive 2023-24
+
+The CSV backend compacts its operation log on its own; to do it by hand:
+
+    python storage.py compact
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from hashlib import md5
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # the columnar snapshot is optional
+    pa = pq = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CSV_FILE = "fees_data.csv"
+DB_FILE = "fees_data.db"
+STORAGE_BACKEND = os.environ.get("FEE_STORAGE_BACKEND", "csv")
+
+# Closed academic years are moved here as compressed, read-only files
+ARCHIVE_DIR = "fees_archive"
+# The current academic year and the one before it (for late payments) stay writable
+OPEN_YEARS = 2
+
+# Column order of the fee ledger; new rows are appended in exactly this order
+FEE_COLUMNS = [
+    "ID", "Student Name", "Class Category", "Class Section", "Month",
+    "Monthly Fee", "Annual Charges", "Admission Fee",
+    "Received Amount", "Date", "Signature", "Entry Timestamp", "Record Key",
+    "Academic Year"
+]
+
+# "ID" identifies the student; "Record Key" identifies one fee record and never changes
+KEY_COLUMN = "Record Key"
+# Academic years run April to March and are labelled like "2025-26"
+YEAR_COLUMN = "Academic Year"
+
+TEXT_COLUMNS = ["ID", "Student Name", "Class Section", "Signature", KEY_COLUMN, YEAR_COLUMN]
+MONEY_COLUMNS = ["Monthly Fee", "Annual Charges", "Admission Fee", "Received Amount"]
+
+CLASS_CATEGORIES = [
+    "Nursery", "KGI", "KGII",
+    "Class 1", "Class 2", "Class 3", "Class 4", "Class 5",
+    "Class 6", "Class 7", "Class 8", "Class 9", "Class 10 (Matric)"
+]
+
+# Months of the academic year, April to March
+MONTHS = [
+    "APRIL", "MAY", "JUNE", "JULY", "AUGUST", "SEPTEMBER",
+    "OCTOBER", "NOVEMBER", "DECEMBER", "JANUARY", "FEBRUARY", "MARCH"
+]
+
+# Declared categories; values outside them are kept as extra categories
+CATEGORY_COLUMNS = {
+    "Class Category": (CLASS_CATEGORIES, False),
+    "Month": (MONTHS, True),
+}
+
+# Formats tried (in order) before falling back to free-form date parsing
+DATE_FORMATS = {
+    "Date": ["%Y-%m-%d", "%d-%m-%Y"],
+    "Entry Timestamp": ["%Y-%m-%d %H:%M:%S", "%d-%m-%Y %H:%M", "%Y-%m-%d %H:%M"],
+}
+
+# Dtypes to read stored text with, so IDs like "1E234567" stay strings
+READ_DTYPES = {col: str for col in TEXT_COLUMNS + list(CATEGORY_COLUMNS)}
+
+
+def generate_student_id(student_name, class_category):
+    """Generate a unique 8-character ID based on student name and class"""
+    unique_str = f"{student_name}_{class_category}".encode('utf-8')
+    return md5(unique_str).hexdigest()[:8].upper()
+
+
+def generate_student_ids(student_names, class_categories):
+    """generate_student_id for whole columns, hashing each name/class pair once"""
+    pairs = pd.DataFrame({"name": student_names, "class": class_categories}).astype(str)
+    codes, unique_pairs = pd.MultiIndex.from_frame(pairs).factorize()
+    ids = np.array([generate_student_id(name, category) for name, category in unique_pairs], dtype=object)
+    return pd.Series(ids[codes], index=pairs.index)
+
+
+def new_record_key():
+    """Random 16-hex-digit key assigned to a fee record when it is first stored"""
+    return uuid.uuid4().hex[:16]
+
+
+def assign_record_keys(df):
+    """Give every row without a Record Key a fresh one (in place)"""
+    if KEY_COLUMN not in df.columns:
+        df[KEY_COLUMN] = np.nan
+    missing = df[KEY_COLUMN].isna()
+    if missing.any():
+        df[KEY_COLUMN] = df[KEY_COLUMN].astype(object)
+        df.loc[missing, KEY_COLUMN] = [new_record_key() for _ in range(int(missing.sum()))]
+    return df
+
+
+def academic_year_label(start_year):
+    """Label of the academic year starting in April of start_year, e.g. 2025-26"""
+    return f"{start_year}-{(start_year + 1) % 100:02d}"
+
+
+def academic_year(date=None):
+    """Academic year a date falls in (today by default)"""
+    date = date or datetime.now()
+    return academic_year_label(date.year if date.month >= 4 else date.year - 1)
+
+
+def open_academic_years():
+    """Writable academic years, newest first"""
+    start = int(academic_year()[:4])
+    return [academic_year_label(start - i) for i in range(OPEN_YEARS)]
+
+
+def assign_academic_years(df):
+    """Fill in missing Academic Year values from the payment date (in place).
+
+    Rows without a usable Date fall back to their Entry Timestamp, then to
+    the current academic year.
+    """
+    if YEAR_COLUMN not in df.columns:
+        df[YEAR_COLUMN] = np.nan
+    missing = df[YEAR_COLUMN].isna()
+    if missing.any():
+        dates = pd.Series(pd.NaT, index=df.index[missing], dtype='datetime64[ns]')
+        for col in DATE_FORMATS:
+            if col in df.columns:
+                values = df.loc[missing, col]
+                if not pd.api.types.is_datetime64_any_dtype(values):
+                    values = parse_dates(values, DATE_FORMATS[col])
+                dates = dates.fillna(values)
+        start = (dates.dt.year - (dates.dt.month < 4)).dropna().astype(int)
+        years = pd.Series(academic_year(), index=dates.index, dtype=object)
+        years[start.index] = [academic_year_label(y) for y in start]
+        df[YEAR_COLUMN] = df[YEAR_COLUMN].astype(object)
+        df.loc[missing, YEAR_COLUMN] = years
+    return df
+
+
+def read_csv_header(path):
+    """Return the header row of a CSV file, or None if the file is empty"""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), None)
+
+
+def parse_dates(values, formats):
+    """Parse a column of dates stored in any of the given formats into datetime64"""
+    values = pd.Series(values, dtype=object)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for fmt in formats:
+        missing = parsed.isna() & values.notna()
+        if not missing.any():
+            return parsed
+        parsed[missing] = pd.to_datetime(values[missing], format=fmt, errors='coerce')
+    missing = parsed.isna() & values.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(values[missing], format='mixed', dayfirst=True, errors='coerce')
+    return parsed
+
+
+def to_category(values, declared, ordered):
+    """Categorical column with the declared categories first, then any extras"""
+    if isinstance(values.dtype, pd.CategoricalDtype) and list(values.cat.categories[:len(declared)]) == declared:
+        return values
+    values = values.astype(object)
+    extras = sorted(set(values.dropna().unique()) - set(declared))
+    return values.astype(pd.CategoricalDtype(declared + extras, ordered=ordered))
+
+
+def apply_schema(df):
+    """Give ledger columns their declared dtypes (idempotent).
+
+    Class Category and Month are categoricals (months in academic order),
+    money columns are int32 with missing amounts as 0, Date and Entry Timestamp
+    are datetime64, and the remaining columns stay as strings. Dates are only
+    turned back into text when they are displayed. Columns that are not
+    present (a partial read) are skipped.
+    """
+    for col in TEXT_COLUMNS:
+        if col in df.columns and df[col].dtype != object:
+            df[col] = df[col].astype(object).where(df[col].notna(), np.nan)
+    for col, (declared, ordered) in CATEGORY_COLUMNS.items():
+        if col in df.columns:
+            df[col] = to_category(df[col], declared, ordered)
+    for col in MONEY_COLUMNS:
+        if col in df.columns and df[col].dtype != np.int32:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).round().astype(np.int32)
+    for col, formats in DATE_FORMATS.items():
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = parse_dates(df[col], formats)
+    return df
+
+
+def normalize_frame(df):
+    """Bring a raw ledger frame into the shape the app expects"""
+    # Ensure all expected columns exist
+    for col in FEE_COLUMNS:
+        if col not in df.columns:
+            df[col] = np.nan
+
+    df = df.dropna(how='all')  # Remove completely empty rows
+    return apply_schema(df.copy())
+
+
+def format_for_storage(df):
+    """Copy of a ledger frame with dates turned back into their stored text format"""
+    df = df.copy()
+    for col, formats in DATE_FORMATS.items():
+        if col in df.columns and pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime(formats[0])
+    return df
+
+
+def concat_ledger(frames):
+    """Concatenate ledger frames, keeping their row ids and the declared dtypes"""
+    return apply_schema(pd.concat(frames))
+
+
+def patch_rows(df, rows):
+    """Overwrite the rows of df that share an index label with rows, in place"""
+    for col in rows.columns:
+        values = rows[col]
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            missing = set(values.dropna()) - set(df[col].cat.categories)
+            if missing:
+                df[col] = df[col].cat.add_categories(sorted(missing))
+        df.loc[rows.index, col] = values.to_numpy()
+    return df
+
+
+def json_value(value):
+    """json.dumps fallback for NumPy scalars and dates"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat(sep=' ') if hasattr(value, 'hour') else value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def write_csv_atomically(df, path):
+    """Write a DataFrame to CSV through a temp file so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".csv", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            df.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def record_version(record):
+    """Version stamp of one fee record (a row of load()): a hash of its stored values.
+
+    Any change to the record changes its stamp, so an edit form can keep the
+    stamp of the record it showed and pass it to update_record() or
+    delete_record(), which refuse to go ahead if the record has moved on.
+    """
+    parts = []
+    for col in FEE_COLUMNS:
+        value = record.get(col)
+        if pd.isna(value):
+            parts.append("")
+        elif col in DATE_FORMATS:
+            parts.append(pd.Timestamp(value).strftime(DATE_FORMATS[col][0]))
+        elif col in MONEY_COLUMNS:
+            parts.append(repr(float(value)))
+        else:
+            parts.append(str(value))
+    return md5("\x1f".join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+class RecordConflict(Exception):
+    """A fee record was changed or deleted after the version an edit was based on"""
+
+    def __init__(self, key, current):
+        state = "deleted" if current is None else "changed"
+        super().__init__(f"Fee record {key} was {state} by someone else in the meantime")
+        self.key = key
+        self.current = current  # the record as stored now, or None if it was deleted
+
+
+def file_signature(path):
+    """Cheap change detector for a file: (mtime, size), or None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def lock_file(f, exclusive=True, blocking=True):
+    """Take an OS lock on an open file; returns False if not blocking and it is taken"""
+    if fcntl is not None:
+        flags = (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(f.fileno(), flags)
+        except BlockingIOError:
+            return False
+        return True
+    # msvcrt only has exclusive locks, on a byte range
+    while True:
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.01)
+
+
+def unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """Lock shared between processes through an OS lock on a lock file.
+
+    Within a process it also works as a thread lock and is re-entrant for
+    the thread holding it; a nested hold keeps the outer mode, so a shared
+    hold cannot be turned into an exclusive one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._file = None
+        self._depth = 0
+        self._exclusive = False
+
+    def acquire(self, exclusive=True, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            if self._depth == 0:
+                f = open(self.path, 'a+b')
+                try:
+                    locked = lock_file(f, exclusive, blocking)
+                except BaseException:
+                    f.close()
+                    raise
+                if not locked:
+                    f.close()
+                    self._thread_lock.release()
+                    return False
+                self._file, self._exclusive = f, exclusive
+            elif exclusive and not self._exclusive:
+                raise RuntimeError(f"{self.path} is held shared and cannot be taken exclusively")
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            unlock_file(self._file)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    @contextmanager
+    def hold(self, exclusive=True):
+        self.acquire(exclusive)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+# Structures derived from the ledger, by name; see register_view()
+_view_builders = {}
+
+
+def register_view(name, build, restore=None, columns=None):
+    """Register a structure derived from the ledger.
+
+    build(df) must return an object with apply_insert(rows) and apply_delete(rows)
+    methods. Each store keeps one instance per process (see FeeStore.view) and
+    feeds it the rows each write adds or removes (an update is a delete of the
+    old row plus an insert of the new one), so it is never rebuilt for a
+    single-record change.
+
+    With restore, the view is also persisted: the store saves its to_json()
+    next to the ledger, stamped with the ledger version, when it is built and
+    a few seconds after writes (off the write path, once for a burst of
+    writes), and restore(data) brings it back without reading the ledger as
+    long as that version is still current.
+
+    With columns, build() is given only those columns of the ledger (writes
+    still pass whole rows), so building it does not need a full read.
+    """
+    _view_builders[name] = (build, restore, columns)
+
+
+class RecordIndex:
+    """Record Key -> row id lookup for one store, kept in step with its writes"""
+
+    def __init__(self, df):
+        self._rows = dict(zip(df[KEY_COLUMN], df.index))
+
+    def apply_insert(self, rows):
+        self._rows.update(zip(rows[KEY_COLUMN], rows.index))
+
+    def apply_delete(self, rows):
+        for key in rows[KEY_COLUMN]:
+            self._rows.pop(key, None)
+
+    def get(self, key):
+        return self._rows.get(key)
+
+
+register_view("record_index", RecordIndex)
+
+
+class FeeStore:
+    """Interface shared by all fee ledger backends.
+
+    load() hands out one process-wide DataFrame that is shared by every
+    Streamlit session, so callers must treat it as read-only. Its index is
+    the backend's row id; records are addressed by their Record Key, which
+    locate() maps to a row id through the "record_index" view. The cache is
+    keyed on version(): writes made through the store update it, anything
+    else that changes the version (e.g. someone editing the file) drops it.
+    Registered views follow the same rules.
+
+    Writes hold the store's write lock, which backends with a lock file share
+    with other processes, from reading the version before the write to
+    reading it after. Appends are group-committed: appends that queue up
+    while another is being written go out together in the next write.
+    """
+
+    _initialized = False
+    _init_lock = threading.Lock()
+    # Seconds after a write before persisted views are saved; later writes ride along
+    VIEW_SAVE_DELAY = 2.0
+
+    def __init__(self, year=None):
+        self.year = year  # academic year this store holds, or None for any
+        self._lock = threading.RLock()
+        self._cache = None  # (version, DataFrame)
+        self._projection = None  # (version, columns, DataFrame) of the last partial read
+        self._views = {}  # name -> (version, derived structure)
+        self._file_lock = None  # FileLock shared with other processes, if the backend has one
+        self._rewrite_lock = None  # FileLock for work that replaces the stored files wholesale
+        self._pending = []  # appends waiting for the next group commit
+        self._pending_lock = threading.Lock()
+        self._view_saver = None  # Timer that will save the persisted views
+        self._view_saver_lock = threading.Lock()
+
+    def ensure_initialized(self):
+        """Run initialize() once per process instead of on every Streamlit rerun"""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if not self._initialized:
+                with self._writing(rewrite=True):
+                    self.initialize()
+                self._initialized = True
+
+    @contextmanager
+    def _writing(self, rewrite=False):
+        """Hold the write lock, against other threads and other processes.
+
+        rewrite first waits for any running compaction (see CsvFeeStore),
+        for writes that replace the stored files.
+        """
+        with self._hold(self._rewrite_lock if rewrite else None):
+            with self._lock, self._hold(self._file_lock):
+                yield
+
+    @contextmanager
+    def _reading(self):
+        """Hold the read lock: no other process writes until it is released"""
+        with self._lock, self._hold(self._file_lock, exclusive=False):
+            yield
+
+    @staticmethod
+    @contextmanager
+    def _hold(lock, exclusive=True):
+        if lock is None:
+            yield
+        else:
+            with lock.hold(exclusive):
+                yield
+
+    def initialize(self):
+        """Create the storage, or bring an existing one up to the current schema"""
+        raise NotImplementedError
+
+    def version(self):
+        """Token that changes whenever the stored records change"""
+        raise NotImplementedError
+
+    def archived(self):
+        """Whether this store's academic year has been moved into a read-only archive"""
+        return bool(self.year) and os.path.exists(archive_path(self.year))
+
+    def _check_open(self):
+        """Refuse a write once the year is archived: its partition is gone (write lock held)"""
+        if self.archived():
+            raise ValueError(f"Academic year {self.year} is archived and read-only")
+
+    def reset(self):
+        """Replace the storage with an empty ledger"""
+        self.replace_all(pd.DataFrame(columns=FEE_COLUMNS))
+
+    def append(self, record):
+        """Add a single fee record and return its Record Key"""
+        record = dict(record)
+        if pd.isna(record.get(KEY_COLUMN)):
+            record[KEY_COLUMN] = new_record_key()
+        if pd.isna(record.get(YEAR_COLUMN)):
+            record[YEAR_COLUMN] = self.year or assign_academic_years(pd.DataFrame([record]))[YEAR_COLUMN].iloc[0]
+        if self.year and record[YEAR_COLUMN] != self.year:
+            raise ValueError(f"A fee record for {record[YEAR_COLUMN]} cannot be stored with academic year {self.year}")
+        return self._group_commit([record])[0]
+
+    def append_many(self, df):
+        """Add many fee records with a single write and return their Record Keys"""
+        df = self._fill_identity(df.reindex(columns=FEE_COLUMNS).copy())
+        if self.year and (df[YEAR_COLUMN] != self.year).any():
+            raise ValueError(f"Only fee records for academic year {self.year} can be stored here")
+        stored = format_for_storage(df).astype(object)
+        stored = stored.where(stored.notna(), None)
+        # Column lists are much faster than to_dict('records') for big batches
+        records = [dict(zip(FEE_COLUMNS, row)) for row in zip(*(stored[col].tolist() for col in FEE_COLUMNS))]
+        return self._group_commit(records)
+
+    def _group_commit(self, records):
+        """Store records together with whatever other appends are queued.
+
+        Each caller queues its records and then takes the write lock; the
+        first to get it writes everything queued so far in one _append_many
+        call (one fsync for the CSV log), and callers whose records went out
+        in that write just return.
+        """
+        if not records:
+            return []
+        self.ensure_initialized()
+        request = {"records": records, "done": False, "error": None}
+        with self._pending_lock:
+            self._pending.append(request)
+        with self._writing():
+            if not request["done"]:
+                with self._pending_lock:
+                    batch, self._pending = self._pending, []
+                try:
+                    self._check_open()
+                    self._append_records([record for queued in batch for record in queued["records"]])
+                except Exception as e:
+                    for queued in batch:
+                        queued["error"] = e
+                for queued in batch:
+                    queued["done"] = True
+        if request["error"] is not None:
+            raise request["error"]
+        return [record[KEY_COLUMN] for record in records]
+
+    def _append_records(self, records):
+        """Write prepared records and move the cache and views past them (write lock held)"""
+        before = self.version()
+        row_ids = self._append_many(records)
+        after = self.version()
+        if row_ids is None:
+            self._cache = None
+            self._views.clear()
+            return
+        new_rows = normalize_frame(pd.DataFrame(records, index=row_ids).reindex(columns=FEE_COLUMNS))
+        if self._cache is not None and self._cache[0] == before:
+            self._cache = (after, concat_ledger([self._cache[1], new_rows]))
+        self._update_views(before, after, inserted=new_rows)
+
+    def locate(self, key):
+        """Row id (index label in load()) of the record with the given Record Key"""
+        row_id = self.view("record_index").get(key)
+        if row_id is None:
+            raise KeyError(f"Fee record {key} not found")
+        return row_id
+
+    def _check_version(self, key, expected_version):
+        """Row id of a record, after making sure it still has expected_version (write lock held)"""
+        try:
+            row_id = self.locate(key)
+        except KeyError:
+            if expected_version is None:
+                raise
+            raise RecordConflict(key, None) from None
+        if expected_version is not None:
+            current = self.load().loc[row_id]
+            if record_version(current) != expected_version:
+                raise RecordConflict(key, current)
+        return row_id
+
+    def update_record(self, key, changes, expected_version=None):
+        """Change some fields of one record; only that record is written.
+
+        With expected_version (see record_version()) the update is refused
+        with RecordConflict if the record was changed or deleted since.
+        """
+        # A record keeps its key, and its academic year decides where it is stored
+        changes = {col: value for col, value in changes.items() if col not in (KEY_COLUMN, YEAR_COLUMN)}
+        with self._writing():
+            self._check_open()
+            row_id = self._check_version(key, expected_version)
+            df = self.load()
+            before = self._cache[0]
+            old_rows = df.loc[[row_id]]
+            stored = format_for_storage(old_rows).iloc[0].to_dict()
+            stored.update(changes)
+            new_rows = normalize_frame(pd.DataFrame([stored], index=[row_id]).reindex(columns=FEE_COLUMNS))
+
+            self._update_record(row_id, key, changes)
+            after = self.version()
+            self._cache = (after, patch_rows(df, new_rows))
+            self._update_views(before, after, inserted=new_rows, deleted=old_rows)
+
+    def delete_record(self, key, expected_version=None):
+        """Remove one record without rewriting the others (expected_version as in update_record)"""
+        with self._writing():
+            self._check_open()
+            row_id = self._check_version(key, expected_version)
+            df = self.load()
+            before = self._cache[0]
+            old_rows = df.loc[[row_id]]
+
+            self._delete_record(row_id, key)
+            after = self.version()
+            self._cache = (after, df.drop(index=row_id))
+            self._update_views(before, after, deleted=old_rows)
+
+    def load(self, columns=None):
+        """Return all fee records as a shared, read-only DataFrame.
+
+        With columns, only those columns are returned; if the full ledger is
+        not already cached, the backend reads just those columns.
+        """
+        return self._load(columns)[1]
+
+    def _load(self, columns=None):
+        """load(), also returning the version the frame reflects"""
+        with self._lock:
+            version = self.version()
+            if self._cache is not None and self._cache[0] == version:
+                df = self._cache[1]
+                return version, (df if columns is None else df[list(columns)])
+            columns = None if columns is None else list(columns)
+            if columns is not None and self._projection is not None and self._projection[:2] == (version, columns):
+                return version, self._projection[2]
+            with self._reading():
+                # Read the version again: another process may have written since
+                version = self.version()
+                df = self._read_all(columns)
+            if columns is None:
+                self._cache = (version, df)
+            else:
+                self._projection = (version, columns, df)
+            return version, df
+
+    def view(self, name):
+        """Return the shared derived structure registered under name"""
+        build, restore, columns = _view_builders[name]
+        with self._lock:
+            version = self.version()
+            cached = self._views.get(name)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            derived = self._restore_view(name, version) if restore else None
+            if derived is None:
+                version, df = self._load(columns)
+                derived = build(df)
+                if restore:
+                    self._save_view(name, version, derived.to_json())
+            self._views[name] = (version, derived)
+            return derived
+
+    def view_path(self, name):
+        """Where the persisted view registered under name is saved"""
+        return f"{self.path}.{name}.json"
+
+    def view_files(self):
+        """Paths of this store's persisted views"""
+        return [self.view_path(name) for name, (_, restore, _) in _view_builders.items() if restore]
+
+    def _restore_view(self, name, version):
+        """The saved view if it was saved at this version of the ledger, else None"""
+        try:
+            with open(self.view_path(name), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("version") != json.loads(json.dumps(version)):
+            return None
+        return _view_builders[name][1](saved["data"])
+
+    def _save_views_later(self):
+        """Have the persisted views saved VIEW_SAVE_DELAY seconds from now, unless that is already due"""
+        with self._view_saver_lock:
+            if self._view_saver is None:
+                self._view_saver = threading.Timer(self.VIEW_SAVE_DELAY, self._save_views)
+                self._view_saver.daemon = True
+                self._view_saver.start()
+
+    def _save_views(self):
+        """Save every current persisted view; writes wait only while their state is copied"""
+        with self._view_saver_lock:
+            self._view_saver = None  # writes from here on need another save
+        if self.archived():
+            return
+        with self._lock:
+            saved = [
+                (name, version, derived.to_json())
+                for name, (version, derived) in self._views.items() if _view_builders[name][1]
+            ]
+        for name, version, data in saved:
+            self._save_view(name, version, data)
+
+    def _save_view(self, name, version, data):
+        """Save a persisted view's to_json() data, stamped with the ledger version it reflects"""
+        path = self.view_path(name)
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"version": version, "data": data}, f, default=json_value)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError):
+            # A missing or outdated file only means the view is built from the ledger again
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def replace_all(self, df):
+        """Overwrite the whole ledger with the given DataFrame"""
+        with self._writing(rewrite=True):
+            self._check_open()
+            self._replace_all(self._fill_identity(df.copy()))
+            self._cache = None
+            self._views.clear()
+
+    def _fill_identity(self, df):
+        """Give rows without them a Record Key and an Academic Year (in place)"""
+        assign_record_keys(df)
+        if self.year:
+            df[YEAR_COLUMN] = df[YEAR_COLUMN].fillna(self.year) if YEAR_COLUMN in df.columns else self.year
+        return assign_academic_years(df)
+
+    def _update_views(self, before, after, inserted=None, deleted=None):
+        """Move views that were current before a write forward (persisted ones are saved later); drop the rest"""
+        persisted = False
+        for name, (version, derived) in list(self._views.items()):
+            if version == before:
+                if deleted is not None:
+                    derived.apply_delete(deleted)
+                if inserted is not None:
+                    derived.apply_insert(inserted)
+                self._views[name] = (after, derived)
+                persisted = persisted or _view_builders[name][1] is not None
+            else:
+                del self._views[name]
+        if persisted:
+            self._save_views_later()
+
+    def _append_many(self, records):
+        """Store several records at once and return their row ids (None if they are not known)"""
+        raise NotImplementedError
+
+    def _update_record(self, row_id, key, changes):
+        raise NotImplementedError
+
+    def _delete_record(self, row_id, key):
+        raise NotImplementedError
+
+    def _read_all(self, columns=None):
+        """Read every record, or only the given columns of every record"""
+        raise NotImplementedError
+
+    def files(self):
+        """Paths of every file this store may keep on disk"""
+        raise NotImplementedError
+
+    def _replace_all(self, df):
+        raise NotImplementedError
+
+
+class CsvFeeStore(FeeStore):
+    """Fee ledger kept as a CSV snapshot plus an append-only operation log.
+
+    Inserts, updates and deletes are appended to <file>.log, one JSON entry
+    per line carrying the record's key, and replayed over the snapshot on
+    load. Once the log grows past COMPACT_BYTES a background thread writes a
+    new snapshot and trims the log down to whatever was logged meanwhile.
+    Replay is idempotent (an insert of a key already in the snapshot replaces
+    it, updates and deletes are by key), so a crash between writing the
+    snapshot and trimming the log only means some entries are applied twice.
+
+    Row ids are snapshot positions, followed by log inserts in log order.
+
+    With pyarrow installed the snapshot is also kept as a typed Parquet file
+    (<name>.parquet) that records the signature of the CSV it was built from.
+    Reads use it while that signature still matches, skipping CSV and date
+    parsing and reading only the requested columns; otherwise they parse the
+    CSV and rebuild it. The CSV stays the source of truth.
+    """
+
+    COMPACT_BYTES = 1024 * 1024
+    COLUMNAR = pq is not None
+
+    def __init__(self, path=CSV_FILE, year=None):
+        super().__init__(year)
+        self.path = path
+        self.log_path = path + ".log"
+        self.columnar_path = os.path.splitext(path)[0] + ".parquet"
+        self._file_lock = FileLock(path + ".lock")
+        self._rewrite_lock = FileLock(path + ".compact.lock")
+        self._next_row_id = None  # (version, row id of the next insert) as of the last read
+        self._compactor = None
+
+    def version(self):
+        return (file_signature(self.path), file_signature(self.log_path))
+
+    def files(self):
+        return [self.path, self.log_path, self.columnar_path, self._file_lock.path, self._rewrite_lock.path] + self.view_files()
+
+    def initialize(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            self.reset()
+            return
+
+        # Only the header is needed to tell whether the file is up to date
+        header = read_csv_header(self.path)
+        if header and header[:len(FEE_COLUMNS)] == FEE_COLUMNS:
+            return
+
+        # Migrate: add any missing columns (giving existing rows their record
+        # keys and academic years) and put the expected ones first
+        df = self.read_raw()
+        for col in FEE_COLUMNS:
+            if col not in df.columns:
+                df[col] = np.nan
+        self._fill_identity(df)
+        extra_columns = [col for col in df.columns if col not in FEE_COLUMNS]
+        self._replace_all(df[FEE_COLUMNS + extra_columns])
+
+    def _append_many(self, records):
+        before = self.version()
+        self._log(*(
+            {"op": "insert", "key": record[KEY_COLUMN],
+             "values": {col: record.get(col) for col in FEE_COLUMNS if col != KEY_COLUMN}}
+            for record in records
+        ))
+        # Row ids are only known if nothing was written since they were last read
+        if self._next_row_id is None or self._next_row_id[0] != before:
+            return None
+        start = self._next_row_id[1]
+        self._next_row_id = (self.version(), start + len(records))
+        return list(range(start, start + len(records)))
+
+    def _update_record(self, row_id, key, changes):
+        self._log({"op": "update", "key": key, "values": changes})
+
+    def _delete_record(self, row_id, key):
+        self._log({"op": "delete", "key": key})
+
+    def _log(self, *entries):
+        lines = "".join(json.dumps(entry, default=json_value, separators=(",", ":")) + "\n" for entry in entries)
+        with open(self.log_path, 'a+b') as f:
+            # A crash mid-write can leave a torn last line; start on a fresh line so
+            # only that unacknowledged entry is skipped on replay, not this one too
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    lines = "\n" + lines
+            f.write(lines.encode('utf-8'))
+            # Make sure the entry is on disk before reporting success
+            f.flush()
+            os.fsync(f.fileno())
+            log_size = f.tell()
+        if log_size > self.COMPACT_BYTES:
+            self.compact_in_background()
+
+    def read_log(self, start=0):
+        """Operation log entries, beginning at byte offset start"""
+        if not os.path.exists(self.log_path):
+            return []
+        entries = []
+        with open(self.log_path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-write; the write was never acknowledged
+                    continue
+        return entries
+
+    @staticmethod
+    def replay(df, entries):
+        """Apply logged operations to a snapshot frame indexed by row id.
+
+        Returns (kept, changed, next row id): the snapshot rows the log leaves
+        alone, and the rows it inserts or modifies (raw, indexed by row id).
+        """
+        next_row_id = int(df.index.max()) + 1 if len(df) else 0
+        snapshot_end = next_row_id
+        if not entries:
+            return df, pd.DataFrame(), next_row_id
+
+        positions = dict(zip(df[KEY_COLUMN], df.index)) if KEY_COLUMN in df.columns else {}
+        rows = {}  # row id -> full record, for every row the log touches
+        deleted = set()
+        for entry in entries:
+            key = entry.get("key")
+            row_id = positions.get(key)
+            if entry.get("op") == "insert":
+                if row_id is None:
+                    row_id = positions[key] = next_row_id
+                    next_row_id += 1
+                rows[row_id] = dict(entry["values"], **{KEY_COLUMN: key})
+                deleted.discard(row_id)
+            elif row_id is None or row_id in deleted:
+                continue
+            elif entry.get("op") == "update":
+                if row_id not in rows:
+                    rows[row_id] = df.loc[row_id].to_dict()
+                rows[row_id].update(entry["values"])
+            elif entry.get("op") == "delete":
+                deleted.add(row_id)
+
+        kept = df.drop(index=[row_id for row_id in set(rows) | deleted if row_id < snapshot_end])
+        for row_id in deleted:
+            rows.pop(row_id, None)
+        return kept, pd.DataFrame.from_dict(rows, orient='index'), next_row_id
+
+    def compact_in_background(self):
+        """Start compact() on a daemon thread unless one is already running"""
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self.compact, name="fee-log-compaction", daemon=True)
+            self._compactor.start()
+
+    def compact(self):
+        """Fold the operation log into a new CSV snapshot.
+
+        Holds the compaction lock throughout, so only one process compacts
+        at a time and nothing else rewrites the snapshot meanwhile; the write
+        lock is only taken to read the ledger and to trim the log, so appends
+        carry on while the new snapshot is written. Returns without doing
+        anything if another compaction is already running.
+        """
+        if not self._rewrite_lock.acquire(blocking=False):
+            return
+        try:
+            with self._writing():
+                log_signature = file_signature(self.log_path)
+                if log_signature is None or self.archived():
+                    return
+                df = self.load()
+            # Writing the snapshot is the slow part; writes may keep logging meanwhile
+            write_csv_atomically(format_for_storage(df), self.path)
+            self._write_columnar(df.set_axis(pd.RangeIndex(len(df))), file_signature(self.path))
+
+            with self._writing():
+                with open(self.log_path, 'rb') as f:
+                    f.seek(log_signature[1])
+                    tail = f.read()
+                if tail:
+                    directory = os.path.dirname(os.path.abspath(self.log_path))
+                    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".log", dir=directory)
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(tail)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.log_path)
+                else:
+                    os.remove(self.log_path)
+                self._cache = None
+                self._views.clear()
+                self._next_row_id = None
+        finally:
+            self._rewrite_lock.release()
+
+    def _read_csv(self):
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=FEE_COLUMNS)
+        try:
+            return pd.read_csv(self.path, dtype=READ_DTYPES)
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame(columns=FEE_COLUMNS)
+        except pd.errors.ParserError:
+            return pd.read_csv(self.path, dtype=READ_DTYPES, on_bad_lines='skip')
+
+    def read_raw(self):
+        """Read the snapshot with the operation log replayed, without normalization"""
+        kept, changed, _ = self.replay(self._read_csv(), self.read_log())
+        if changed.empty:
+            return kept
+        return pd.concat([kept, changed]).sort_index(kind='stable')
+
+    def _read_columnar(self, columns=None):
+        """The typed snapshot if it was built from the current CSV, else None"""
+        if not self.COLUMNAR or not os.path.exists(self.columnar_path):
+            return None
+        try:
+            metadata = pq.read_schema(self.columnar_path).metadata or {}
+            built_from = json.loads(metadata.get(b"fee_csv_signature", b"null"))
+            if built_from is None or tuple(built_from) != file_signature(self.path):
+                return None
+            return apply_schema(pd.read_parquet(self.columnar_path, engine='pyarrow', columns=columns))
+        except (OSError, ValueError, pa.ArrowException):
+            return None
+
+    def _write_columnar(self, df, csv_signature):
+        """Save df, the typed contents of the CSV with csv_signature, as the columnar snapshot.
+
+        Nothing is saved if the CSV has been replaced since: stamping its
+        signature on older data would hide the records the new CSV holds.
+        """
+        if not self.COLUMNAR or csv_signature is None or file_signature(self.path) != csv_signature:
+            return
+        directory = os.path.dirname(os.path.abspath(self.columnar_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".parquet", dir=directory)
+        os.close(fd)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+            metadata = dict(table.schema.metadata or {})
+            metadata[b"fee_csv_signature"] = json.dumps(csv_signature).encode()
+            pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+            os.replace(tmp_path, self.columnar_path)
+        except (OSError, ValueError, TypeError, pa.ArrowException):
+            # The CSV is the source of truth; without a snapshot reads just parse it
+            os.remove(tmp_path)
+
+    def _read_snapshot(self, columns=None):
+        """The CSV snapshot with declared dtypes, indexed by row id"""
+        df = self._read_columnar(columns)
+        if df is None:
+            # The signature of the CSV that is parsed, taken before parsing it
+            csv_signature = file_signature(self.path)
+            df = normalize_frame(self._read_csv())
+            self._write_columnar(df, csv_signature)
+            if columns is not None:
+                df = df[columns]
+        return df
+
+    def _read_all(self, columns=None):
+        version = self.version()
+        # Without a snapshot the log alone is the ledger
+        if version == (None, None):
+            self._next_row_id = None
+            return pd.DataFrame(columns=columns) if columns else pd.DataFrame()
+        # The key column is always needed to replay the log
+        read_columns = None if columns is None else list(dict.fromkeys(columns + [KEY_COLUMN]))
+        kept, changed, next_row_id = self.replay(self._read_snapshot(read_columns), self.read_log())
+        self._next_row_id = (version, next_row_id)
+        df = kept
+        if not changed.empty:
+            changed = normalize_frame(changed)[list(kept.columns)]
+            df = concat_ledger([kept, changed]).sort_index(kind='stable')
+        return df if columns is None else df[columns]
+
+    def _replace_all(self, df):
+        write_csv_atomically(format_for_storage(df), self.path)
+        # The rewrite already contains every logged operation; start a fresh log.
+        # The columnar snapshot is now stale and is rebuilt by the next read.
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._next_row_id = None
+
+
+class SqliteFeeStore(FeeStore):
+    """Fee ledger kept in an indexed SQLite database running in WAL mode"""
+
+    TABLE = "fees"
+    INDEXES = {
+        "idx_fees_id": ["ID"],
+        "idx_fees_id_month": ["ID", "Month"],
+        "idx_fees_class": ["Class Category"],
+        "idx_fees_date": ["Date"],
+    }
+    UNIQUE_INDEXES = {
+        "idx_fees_record_key": [KEY_COLUMN],
+    }
+
+    def __init__(self, path=DB_FILE, year=None):
+        super().__init__(year)
+        self.path = path
+        # SQLite locks the data itself; this keeps the cache in step with other processes
+        self._file_lock = FileLock(path + ".lock")
+
+    def version(self):
+        # Committed WAL-mode writes land in the -wal file before a checkpoint
+        return (file_signature(self.path), file_signature(self.path + "-wal"))
+
+    def files(self):
+        return [self.path, self.path + "-wal", self.path + "-shm", self._file_lock.path] + self.view_files()
+
+    def connect(self):
+        """Open a connection; one per operation keeps Streamlit's threads independent"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def initialize(self):
+        column_defs = ", ".join(
+            f'"{col}" {"NUMERIC" if col in MONEY_COLUMNS else "TEXT"}' for col in FEE_COLUMNS
+        )
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {self.TABLE} ({column_defs})')
+                existing = {row[1] for row in conn.execute(f'PRAGMA table_info({self.TABLE})')}
+                for col in FEE_COLUMNS:
+                    if col not in existing:
+                        conn.execute(f'ALTER TABLE {self.TABLE} ADD COLUMN "{col}"')
+                # Rows stored before record keys existed get one now
+                conn.execute(f'UPDATE {self.TABLE} SET "{KEY_COLUMN}" = lower(hex(randomblob(8))) '
+                             f'WHERE "{KEY_COLUMN}" IS NULL')
+                # ... and their academic year
+                undated = pd.read_sql_query(
+                    f'SELECT rowid AS row_id, "Date", "Entry Timestamp", "{YEAR_COLUMN}" FROM {self.TABLE} '
+                    f'WHERE "{YEAR_COLUMN}" IS NULL', conn, index_col='row_id'
+                )
+                if len(undated):
+                    years = self._fill_identity(undated)[YEAR_COLUMN]
+                    conn.executemany(f'UPDATE {self.TABLE} SET "{YEAR_COLUMN}" = ? WHERE rowid = ?',
+                                     [(year, int(row_id)) for row_id, year in years.items()])
+                for name, columns in self.INDEXES.items():
+                    quoted = ", ".join(f'"{col}"' for col in columns)
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {self.TABLE} ({quoted})')
+                for name, columns in self.UNIQUE_INDEXES.items():
+                    quoted = ", ".join(f'"{col}"' for col in columns)
+                    conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {self.TABLE} ({quoted})')
+        finally:
+            conn.close()
+
+    def _insert_sql(self):
+        quoted = ", ".join(f'"{col}"' for col in FEE_COLUMNS)
+        placeholders = ", ".join("?" for _ in FEE_COLUMNS)
+        return f'INSERT INTO {self.TABLE} ({quoted}) VALUES ({placeholders})'
+
+    @staticmethod
+    def _to_sql_value(col, value):
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            return None
+        if col in DATE_FORMATS and hasattr(value, 'strftime'):
+            # Dates are stored as text in their first (canonical) format
+            return value.strftime(DATE_FORMATS[col][0])
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    def _rows(self, df):
+        df = format_for_storage(df.reindex(columns=FEE_COLUMNS))
+        return [
+            tuple(self._to_sql_value(col, value) for col, value in zip(FEE_COLUMNS, row))
+            for row in df.itertuples(index=False, name=None)
+        ]
+
+    def _append_many(self, records):
+        rows = [tuple(self._to_sql_value(col, record.get(col)) for col in FEE_COLUMNS) for record in records]
+        conn = self.connect()
+        try:
+            with conn:
+                # Hold the write lock so the new rows get consecutive rowids
+                conn.execute("BEGIN IMMEDIATE")
+                start = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {self.TABLE}').fetchone()[0]
+                conn.executemany(self._insert_sql(), rows)
+            return list(range(start + 1, start + 1 + len(rows)))
+        finally:
+            conn.close()
+
+    def _update_record(self, row_id, key, changes):
+        columns = [col for col in changes if col in FEE_COLUMNS]
+        assignments = ", ".join(f'"{col}" = ?' for col in columns)
+        values = [self._to_sql_value(col, changes[col]) for col in columns]
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute(f'UPDATE {self.TABLE} SET {assignments} WHERE rowid = ?', values + [int(row_id)])
+        finally:
+            conn.close()
+
+    def _delete_record(self, row_id, key):
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute(f'DELETE FROM {self.TABLE} WHERE rowid = ?', (int(row_id),))
+        finally:
+            conn.close()
+
+    def _read_all(self, columns=None):
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=columns) if columns else pd.DataFrame()
+        quoted = ", ".join(f'"{col}"' for col in columns or FEE_COLUMNS)
+        conn = self.connect()
+        try:
+            df = pd.read_sql_query(
+                f'SELECT rowid AS row_id, {quoted} FROM {self.TABLE} ORDER BY rowid', conn,
+                index_col='row_id'
+            )
+        finally:
+            conn.close()
+        df.index.name = None
+        df = normalize_frame(df)
+        return df if columns is None else df[columns]
+
+    def _replace_all(self, df):
+        rows = self._rows(df)
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute(f'DELETE FROM {self.TABLE}')
+                conn.executemany(self._insert_sql(), rows)
+        finally:
+            conn.close()
+
+    def count(self):
+        """Number of stored fee records"""
+        conn = self.connect()
+        try:
+            return conn.execute(f'SELECT COUNT(*) FROM {self.TABLE}').fetchone()[0]
+        finally:
+            conn.close()
+
+
+class ArchivedFeeStore(FeeStore):
+    """A closed academic year, kept as one compressed file that is never written again.
+
+    Parquet (zstd) when pyarrow is installed, gzipped CSV otherwise.
+    """
+
+    def __init__(self, path, year=None):
+        super().__init__(year)
+        self.path = path
+
+    def version(self):
+        return file_signature(self.path)
+
+    def files(self):
+        return [self.path] + self.view_files()
+
+    def initialize(self):
+        pass
+
+    def _read_only(self, *args):
+        raise ValueError(f"Academic year {self.year} is archived and read-only")
+
+    _append_many = _update_record = _delete_record = _replace_all = _read_only
+
+    def _read_all(self, columns=None):
+        if self.path.endswith(".parquet"):
+            return apply_schema(pd.read_parquet(self.path, engine='pyarrow', columns=columns))
+        df = normalize_frame(pd.read_csv(self.path, dtype=READ_DTYPES, compression='gzip'))
+        return df if columns is None else df[columns]
+
+    @staticmethod
+    def write(df, path):
+        """Write a ledger frame as an archive file at path (.parquet or .csv.gz)"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+        os.close(fd)
+        try:
+            df = df.reset_index(drop=True)
+            if path.endswith(".parquet"):
+                df.to_parquet(tmp_path, engine='pyarrow', compression='zstd', index=False)
+            else:
+                format_for_storage(df).to_csv(tmp_path, index=False, compression='gzip')
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+BACKENDS = {
+    "csv": CsvFeeStore,
+    "sqlite": SqliteFeeStore,
+}
+
+# Unpartitioned ledger of each backend; partitions are named after it
+BACKEND_FILES = {
+    "csv": CSV_FILE,
+    "sqlite": DB_FILE,
+}
+
+_stores = {}
+_stores_lock = threading.Lock()
+_storage_ready = set()
+
+
+def check_backend(backend):
+    backend = backend or STORAGE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+    return backend
+
+
+def partition_path(backend, year):
+    """Writable partition of one academic year, e.g. fees_data_2025-26.csv"""
+    root, ext = os.path.splitext(BACKEND_FILES[backend])
+    return f"{root}_{year}{ext}"
+
+
+def archive_path(year):
+    """Archive file of a closed academic year; an existing one wins over the preferred format"""
+    for ext in (".parquet", ".csv.gz"):
+        path = os.path.join(ARCHIVE_DIR, f"fees_{year}{ext}")
+        if os.path.exists(path):
+            return path
+    return os.path.join(ARCHIVE_DIR, f"fees_{year}" + (".parquet" if pq is not None else ".csv.gz"))
+
+
+def partition_years(backend=None):
+    """Academic years that have a writable partition"""
+    backend = check_backend(backend)
+    root, ext = os.path.splitext(BACKEND_FILES[backend])
+    prefix = f"{root}_"
+    return sorted(path[len(prefix):-len(ext)] for path in glob.glob(f"{glob.escape(prefix)}*{ext}"))
+
+
+def academic_years(backend=None):
+    """Every academic year with stored fee records, plus the current one, newest first"""
+    archived = [
+        os.path.basename(path)[len("fees_"):].split(".")[0]
+        for path in glob.glob(os.path.join(ARCHIVE_DIR, "fees_*"))
+    ]
+    return sorted(set(partition_years(backend) + archived + [academic_year()]), reverse=True)
+
+
+def get_store(year=None, backend=None):
+    """Return the shared store of one academic year (the current one by default).
+
+    Only that year's files are opened: its writable partition for the
+    configured (or given) backend, or its archive once the year is closed.
+    """
+    backend = check_backend(backend)
+    year = year or academic_year()
+    with _stores_lock:
+        store = _stores.get((backend, year))
+        # A partition archived by another process is read from its archive from then on
+        if store is None or (not isinstance(store, ArchivedFeeStore) and store.archived()):
+            archive = archive_path(year)
+            if os.path.exists(archive):
+                _stores[(backend, year)] = ArchivedFeeStore(archive, year)
+            else:
+                _stores[(backend, year)] = BACKENDS[backend](partition_path(backend, year), year=year)
+        return _stores[(backend, year)]
+
+
+def load_years(years, columns=None, backend=None):
+    """Fee records of several academic years in one frame (index is not a row id)"""
+    frames = [get_store(year, backend).load(columns) for year in years]
+    frames = [df for df in frames if len(df.columns)]
+    if not frames:
+        return pd.DataFrame(columns=columns or FEE_COLUMNS)
+    return concat_ledger(frames).reset_index(drop=True)
+
+
+def archive_year(year, backend=None):
+    """Move a closed academic year from its writable partition into a read-only archive"""
+    backend = check_backend(backend)
+    if year in open_academic_years():
+        raise ValueError(f"Academic year {year} is still open for fee entry")
+    hot = BACKENDS[backend](partition_path(backend, year), year=year)
+    if not os.path.exists(hot.path):
+        return None
+    path = archive_path(year)
+    # No other process writes to the partition while it is copied and removed;
+    # writers waiting for it find the archive and refuse (see _check_open)
+    lock_files = [lock.path for lock in (hot._file_lock, hot._rewrite_lock) if lock is not None]
+    with hot._writing(rewrite=True):
+        if not os.path.exists(hot.path):
+            return None
+        df = hot.load()
+        if os.path.exists(path):
+            # A previous run stopped before removing the partition
+            df = concat_ledger([ArchivedFeeStore(path, year).load(), df]).drop_duplicates(KEY_COLUMN, keep='last')
+        ArchivedFeeStore.write(df, path)
+        for file in hot.files():
+            if file not in lock_files and os.path.exists(file):
+                os.remove(file)
+    # Lock files go once they are released (Windows cannot remove open files)
+    for file in lock_files:
+        if os.path.exists(file):
+            os.remove(file)
+    with _stores_lock:
+        _stores.pop((backend, year), None)
+    return path
+
+
+def partition_legacy_ledger(backend=None):
+    """Split a ledger saved before academic-year partitions into one partition per year.
+
+    The old file is kept next to the partitions as <file>.pre-partition.
+    Rerunning after an interruption is safe: records are matched by key.
+    """
+    backend = check_backend(backend)
+    legacy = BACKENDS[backend](BACKEND_FILES[backend])
+    if not os.path.exists(legacy.path):
+        return 0
+    legacy.ensure_initialized()
+    df = legacy._fill_identity(legacy.load().copy())
+    for year, rows in df.groupby(YEAR_COLUMN, sort=True):
+        store = BACKENDS[backend](partition_path(backend, year), year=year)
+        store.ensure_initialized()
+        rows = concat_ledger([store.load(), rows]) if len(store.load().columns) else rows
+        store.replace_all(rows.drop_duplicates(KEY_COLUMN, keep='last'))
+
+    os.replace(legacy.path, legacy.path + ".pre-partition")
+    for file in legacy.files()[1:]:
+        if os.path.exists(file):
+            os.remove(file)
+    return len(df)
+
+
+def initialize_storage(backend=None):
+    """Bring the fee storage up to date once per process.
+
+    Splits an unpartitioned ledger into academic years, archives years that
+    are no longer open and creates the current year's partition.
+    """
+    backend = check_backend(backend)
+    with _stores_lock:
+        if backend in _storage_ready:
+            return
+    partition_legacy_ledger(backend)
+    open_years = open_academic_years()
+    for year in partition_years(backend):
+        if year not in open_years:
+            archive_year(year, backend)
+    get_store(backend=backend).ensure_initialized()
+    with _stores_lock:
+        _storage_ready.add(backend)
+
+
+def migrate_csv_to_sqlite(csv_path=CSV_FILE, db_path=DB_FILE, force=False):
+    """Copy every record from a CSV ledger into a SQLite database"""
+    source = CsvFeeStore(csv_path)
+    target = SqliteFeeStore(db_path)
+    target.initialize()
+    if target.count() and not force:
+        raise ValueError(f"{db_path} already contains fee records; use --force to replace them")
+
+    df = source.read_raw().dropna(how='all')
+    target.replace_all(df)
+    return len(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="School fee ledger storage tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate", help="Copy the CSV partitions into SQLite")
+    migrate.add_argument("--year", action="append", help="Academic year to copy (default: every open year)")
+    migrate.add_argument("--force", action="store_true", help="Replace records already in the database")
+
+    compact = subparsers.add_parser("compact", help="Fold the CSV operation log into the snapshot")
+    compact.add_argument("--year", default=None, help="Academic year (default: the current one)")
+
+    archive = subparsers.add_parser("archive", help="Move a closed academic year into a read-only archive")
+    archive.add_argument("year", help="Academic year, e.g. 2023-24")
+    archive.add_argument("--backend", default=None, choices=list(BACKENDS), help="Backend holding the year")
+
+    args = parser.parse_args(argv)
+    if args.command == "compact":
+        path = partition_path("csv", args.year or academic_year())
+        CsvFeeStore(path).compact()
+        print(f"Compacted {path}")
+    elif args.command == "archive":
+        try:
+            path = archive_year(args.year, args.backend)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Archived {args.year} to {path}" if path else f"No writable partition for {args.year}")
+    elif args.command == "migrate":
+        initialize_storage("csv")
+        for year in args.year or [y for y in partition_years("csv") if y in open_academic_years()]:
+            csv_path, db_path = partition_path("csv", year), partition_path("sqlite", year)
+            try:
+                count = migrate_csv_to_sqlite(csv_path, db_path, force=args.force)
+            except ValueError as e:
+                parser.error(str(e))
+            print(f"Migrated {count} fee records from {csv_path} to {db_path}")
+        print("Set FEE_STORAGE_BACKEND=sqlite to use the databases")
+
+
+if __name__ == "__main__":
+    main()
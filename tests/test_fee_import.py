@@ -0,0 +1,99 @@
+import io
+
+import pandas as pd
+
+from fee_import import REASON_COLUMN, ROW_COLUMN, read_chunks, validate_chunk
+from storage import OPEN_YEARS, YEAR_COLUMN, academic_year, academic_year_label, generate_student_id
+
+# Academic years open and closed today, so the tests don't depend on the date they run
+START = int(academic_year()[:4])
+OPEN_YEAR, PREVIOUS_YEAR = academic_year_label(START), academic_year_label(START - 1)
+CLOSED_YEAR = academic_year_label(START - OPEN_YEARS)
+
+
+def row(**values):
+    base = {
+        "Student Name": "Ali", "Class Category": "KGI", "Month": "may", "Monthly Fee": "1,000",
+        "Annual Charges": "", "Admission Fee": "", "Received Amount": "1000",
+        "Date": f"{START}-05-10", "Signature": "office",
+    }
+    return dict(base, **values)
+
+
+def validate(*rows, **kwargs):
+    return validate_chunk(pd.DataFrame(list(rows)), **kwargs)
+
+
+def reason(**values):
+    accepted, rejected = validate(row(**values))
+    assert accepted.empty
+    return rejected[REASON_COLUMN].iloc[0]
+
+
+def test_valid_row_is_accepted_in_the_stored_layout():
+    accepted, rejected = validate(row())
+    assert rejected.empty
+    record = accepted.iloc[0]
+    assert record["Month"] == "MAY"
+    assert record["Monthly Fee"] == 1000
+    assert record["Annual Charges"] == 0
+    assert record["Date"] == f"{START}-05-10"
+
+
+def test_each_rejection_reason():
+    assert reason(**{"Student Name": " "}) == "missing Student Name"
+    assert reason(**{"Class Category": "KG3"}) == "unknown Class Category KG3"
+    assert reason(Month="Maytember") == "unknown Month MAYTEMBER"
+    assert reason(**{"Received Amount": "a lot"}) == "Received Amount is not a number"
+    assert reason(**{"Monthly Fee": "-5"}) == "negative Monthly Fee"
+    assert reason(Date="early May") == "unreadable Date"
+    assert reason(**{"Entry Timestamp": "yesterday"}) == "unreadable Entry Timestamp"
+    assert reason(Signature="") == "missing Signature"
+
+
+def test_every_reason_of_a_row_is_reported():
+    assert reason(**{"Student Name": None, "Class Category": None}) == (
+        "missing Student Name; unknown Class Category (blank)"
+    )
+
+
+def test_default_signature_fills_blank_ones():
+    accepted, _ = validate(row(Signature=""), signature="import")
+    assert accepted["Signature"].tolist() == ["import"]
+
+
+def test_batch_ids_match_generate_student_id():
+    accepted, _ = validate(row(), row(Month="June"), row(**{"Student Name": "Sara", "Class Category": "Class 1"}))
+    assert accepted["ID"].tolist() == [
+        generate_student_id("Ali", "KGI"), generate_student_id("Ali", "KGI"), generate_student_id("Sara", "Class 1")
+    ]
+
+
+def test_given_ids_are_kept():
+    accepted, _ = validate(row(ID="ABCD1234"))
+    assert accepted["ID"].tolist() == ["ABCD1234"]
+
+
+def test_academic_year_comes_from_the_payment_date():
+    accepted, _ = validate(row(), row(Date=f"{START}-03-31"))
+    assert accepted[YEAR_COLUMN].tolist() == [OPEN_YEAR, PREVIOUS_YEAR]
+
+
+def test_closed_academic_year_is_refused():
+    assert reason(Date=f"{START - OPEN_YEARS}-05-10") == f"academic year {CLOSED_YEAR} is closed"
+    _, rejected = validate(row(), year=CLOSED_YEAR)
+    assert rejected[REASON_COLUMN].tolist() == [f"academic year {CLOSED_YEAR} is closed"]
+
+
+def test_rows_are_numbered_across_chunks():
+    rows = [row(), row(Month="never"), row(), row(), row(Month="never")]
+    source = io.StringIO(pd.DataFrame(rows).to_csv(index=False))
+    rejected = pd.concat([validate_chunk(chunk)[1] for chunk in read_chunks(source, "fees.csv", chunk_rows=2)])
+    # Spreadsheet rows: the header is row 1
+    assert rejected[ROW_COLUMN].tolist() == [3, 6]
+
+
+def test_blank_lines_are_skipped():
+    accepted, rejected = validate_chunk(pd.DataFrame([row(), {}]))
+    assert len(accepted) == 1
+    assert rejected.empty
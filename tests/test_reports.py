@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fee_schedule import save_schedule
+from reports import (
+    AGING_BUCKETS, FeeAllocation, PaymentStatusMatrix, aging_buckets, allocate_payments, arrears_aging,
+    month_ages
+)
+from storage import MONTHS
+
+YEAR = "2025-26"
+
+
+def fee_record(name, month="APRIL", fee=1000, received=1000, annual=0, admission=0):
+    return {
+        "ID": name.upper(), "Student Name": name, "Class Category": "KGI", "Month": month,
+        "Monthly Fee": fee, "Annual Charges": annual, "Admission Fee": admission,
+        "Received Amount": received, "Academic Year": YEAR,
+    }
+
+
+def ledger(*records):
+    return pd.DataFrame(list(records))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # The fee schedule is read from the working directory
+    monkeypatch.chdir(tmp_path)
+
+
+def schedule(*entries):
+    save_schedule(pd.DataFrame([
+        {"Class Category": "KGI", "Academic Year": YEAR, "Fee Head": head, "Amount": amount,
+         "Effective From": effective}
+        for head, amount, effective in entries
+    ]))
+
+
+def test_scheduled_annual_charge_is_due_in_its_month():
+    schedule(("Annual Charges", 5000, "2025-06-15"))
+    matrix = PaymentStatusMatrix.from_frame(ledger(fee_record("a")))
+    june = MONTHS.index("JUNE")
+    assert matrix.charges[0, june] == 5000
+    assert matrix.charges.sum() == 5000
+    assert matrix.month_frame("JUNE").loc[0, "Balance Due"] == 6000
+
+
+def test_recorded_charge_replaces_the_scheduled_one():
+    schedule(("Annual Charges", 5000, None), ("Admission Fee", 2000, None))
+    matrix = PaymentStatusMatrix.from_frame(ledger(fee_record("a", annual=3000), fee_record("b")))
+    assert list(matrix.charges.sum(axis=1)) == [3000 + 2000, 5000 + 2000]
+
+
+def test_scheduled_charge_follows_recorded_changes():
+    schedule(("Annual Charges", 5000, None))
+    matrix = PaymentStatusMatrix.from_frame(ledger(fee_record("a")))
+    assert matrix.allocation().outstanding.sum() == 5000 + 11 * 1000
+    recorded = ledger(fee_record("a", month="MAY", annual=4000))
+    matrix.apply_insert(recorded)
+    assert matrix.charges.sum() == 4000
+    matrix.apply_delete(recorded)
+    assert matrix.charges.sum() == 5000
+    assert np.isclose(matrix.allocation().outstanding.sum(), 5000 + 11 * 1000)
+
+
+def test_student_months_take_balances_from_the_allocation():
+    # 1500 paid in April covers April and half of May
+    matrix = PaymentStatusMatrix.from_frame(ledger(fee_record("b"), fee_record("a", received=1500)))
+    months = matrix.student_months("A").set_index("Month")
+    assert months.loc["APRIL", "Status"] == "Paid"
+    assert months.loc["MAY", "Balance Due"] == 500
+    assert months.loc["MAY", "Status"] == "Unpaid"
+    assert months.loc["APRIL", "Running Balance"] == -500
+    assert matrix.student_months("Z") is None
+
+
+def test_allocate_payments_covers_oldest_dues_first():
+    allocated = allocate_payments(np.array([[1000., 1000., 1000.]]), np.array([1500.]))
+    assert allocated.tolist() == [[1000, 500, 0]]
+
+
+def test_allocate_payments_ignores_negative_dues_and_payments():
+    allocated = allocate_payments(np.array([[-200., 1000.], [1000., 1000.]]), np.array([300., -50.]))
+    assert allocated.tolist() == [[0, 300], [0, 0]]
+
+
+def test_overpayment_is_carried_forward_to_later_months():
+    # Three months' fees paid in April
+    allocation = FeeAllocation(np.full((1, 4), 1000.), np.array([[3000., 0., 0., 0.]]))
+    assert allocation.outstanding.tolist() == [[0, 0, 0, 1000]]
+    assert allocation.credit.tolist() == [0]
+
+
+def test_underpayment_leaves_the_newest_months_outstanding():
+    allocation = FeeAllocation(np.full((1, 3), 1000.), np.array([[0., 800., 700.]]))
+    assert allocation.allocated.tolist() == [[1000, 500, 0]]
+    assert allocation.outstanding.tolist() == [[0, 500, 1000]]
+
+
+def test_payments_beyond_every_due_become_credit():
+    allocation = FeeAllocation(np.full((2, 2), 1000.), np.array([[2500., 0.], [1000., 0.]]))
+    assert allocation.outstanding.sum() == 1000
+    assert allocation.credit.tolist() == [500, 0]
+
+
+def test_running_balance_is_dues_less_payments_to_date():
+    allocation = FeeAllocation(np.array([[6000., 1000., 1000.]]), np.array([[1000., 3000., 0.]]))
+    assert allocation.running_balance.tolist() == [[5000, 3000, 4000]]
+
+
+def test_annual_and_admission_dues_are_paid_before_later_months():
+    records = [fee_record("a", annual=5000, admission=2000, received=9000)]
+    records += [fee_record("a", month=month, received=0) for month in ("MAY", "JUNE")]
+    matrix = PaymentStatusMatrix.from_frame(ledger(*records))
+    allocation = matrix.allocation()
+    april, may, june = (MONTHS.index(month) for month in ("APRIL", "MAY", "JUNE"))
+    assert allocation.due[0, april] == 1000 + 5000 + 2000
+    assert allocation.outstanding[0, april] == 0
+    assert allocation.outstanding[0, may] == 0
+    assert allocation.outstanding[0, june] == 1000
+    assert allocation.credit[0] == 0
+
+
+def test_month_ages_count_whole_months_and_future_months_are_negative():
+    ages = month_ages(YEAR, MONTHS, on="2025-06-20")
+    assert ages[:4].tolist() == [2, 1, 0, -1]
+    assert ages[-1] == -9  # March 2026
+
+
+def test_month_ages_without_a_year_take_every_month_as_due():
+    assert month_ages(None, MONTHS).tolist() == list(range(11, -1, -1))
+
+
+def test_aging_buckets_sum_outstanding_by_age():
+    outstanding = np.array([[100., 200., 300., 400., 500., 600., 700.]])
+    ages = np.array([6, 5, 3, 2, 1, 0, -1])
+    assert aging_buckets(outstanding, ages).tolist() == [[600, 900, 500, 100]]
+    assert len(AGING_BUCKETS) == 4
+
+
+def test_months_not_yet_due_are_left_out_of_aging():
+    outstanding = np.array([[1000., 1000., 1000.]])
+    assert aging_buckets(outstanding, np.array([0, -1, -2])).sum() == 1000
+
+
+def test_arrears_aging_per_student_and_class():
+    # On 20 June April and May are overdue; the rest of the year is not yet due
+    matrix = PaymentStatusMatrix.from_frame(ledger(fee_record("a", received=0), fee_record("b", received=12000)))
+    students, classes = arrears_aging(matrix, on="2025-06-20")
+    a = students.set_index("ID").loc["A"]
+    assert (a["Current"], a["1-2 Months"], a["3-5 Months"], a["6+ Months"]) == (1000, 2000, 0, 0)
+    assert a["Total Outstanding"] == 3000
+    assert students.set_index("ID").loc["B", "Total Outstanding"] == 0
+    kgi = classes.set_index("Class Category").loc["KGI"]
+    assert kgi["Total Outstanding"] == 3000
+    assert kgi["Students in Arrears"] == 1
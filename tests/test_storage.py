@@ -0,0 +1,281 @@
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+from storage import (
+    FEE_COLUMNS, KEY_COLUMN, ArchivedFeeStore, CsvFeeStore, FileLock, RecordConflict, SqliteFeeStore,
+    archive_path, archive_year, format_for_storage, get_store, partition_path, record_version,
+    write_csv_atomically
+)
+
+YEAR = "2025-26"
+
+
+def fee_record(name, month="APRIL", received=1000):
+    return {
+        "ID": name.upper(), "Student Name": name, "Class Category": "KGI", "Month": month,
+        "Monthly Fee": 1000, "Annual Charges": 0, "Admission Fee": 0, "Received Amount": received,
+        "Date": "10-05-2025", "Signature": "office", "Entry Timestamp": "10-05-2025 09:00",
+    }
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "csv":
+        return CsvFeeStore(str(tmp_path / "fees.csv"), year=YEAR)
+    return SqliteFeeStore(str(tmp_path / "fees.db"), year=YEAR)
+
+
+def snapshot(*names):
+    df = pd.DataFrame([dict(fee_record(name), **{KEY_COLUMN: f"k-{name}", "Academic Year": YEAR}) for name in names])
+    return df.reindex(columns=FEE_COLUMNS)
+
+
+def insert(name, **values):
+    return {"op": "insert", "key": f"k-{name}", "values": dict(fee_record(name), **values)}
+
+
+def replayed(df, entries):
+    kept, changed, _ = CsvFeeStore.replay(df, entries)
+    return pd.concat([kept, changed]).sort_index() if len(changed) else kept
+
+
+def test_replay_insert_of_existing_key_replaces_the_row():
+    df = replayed(snapshot("a", "b"), [insert("a", **{"Received Amount": 400})])
+    assert list(df[KEY_COLUMN]) == ["k-a", "k-b"]
+    assert df.loc[0, "Received Amount"] == 400
+
+
+def test_replay_twice_gives_the_same_ledger():
+    entries = [insert("c"), {"op": "update", "key": "k-c", "values": {"Received Amount": 300}},
+               {"op": "delete", "key": "k-a"}]
+    once = replayed(snapshot("a", "b"), entries)
+    # As after a crash between writing the snapshot and trimming the log
+    twice = replayed(format_for_storage(once).reset_index(drop=True), entries)
+    assert list(once[KEY_COLUMN]) == list(twice[KEY_COLUMN]) == ["k-b", "k-c"]
+    assert twice.set_index(KEY_COLUMN).loc["k-c", "Received Amount"] == 300
+
+
+def test_replay_ignores_updates_and_deletes_after_a_delete():
+    entries = [{"op": "delete", "key": "k-a"},
+               {"op": "update", "key": "k-a", "values": {"Received Amount": 1}},
+               {"op": "delete", "key": "k-a"},
+               {"op": "update", "key": "k-missing", "values": {"Received Amount": 1}}]
+    df = replayed(snapshot("a", "b"), entries)
+    assert list(df[KEY_COLUMN]) == ["k-b"]
+
+
+def test_replay_reinsert_after_delete_brings_the_row_back():
+    df = replayed(snapshot("a"), [{"op": "delete", "key": "k-a"}, insert("a", **{"Received Amount": 5})])
+    assert list(df[KEY_COLUMN]) == ["k-a"]
+    assert df["Received Amount"].tolist() == [5]
+
+
+def test_compaction_racing_appends_loses_and_duplicates_nothing(tmp_path):
+    path = str(tmp_path / "fees.csv")
+    writer, compactor = CsvFeeStore(path, year=YEAR), CsvFeeStore(path, year=YEAR)
+    writer.ensure_initialized()
+    keys, done = [], threading.Event()
+
+    def append(thread):
+        for i in range(60):
+            keys.append(writer.append(fee_record(f"s{thread}-{i}")))
+
+    def compact():
+        while not done.is_set():
+            compactor.compact()
+
+    appenders = [threading.Thread(target=append, args=(t,)) for t in range(4)]
+    compacting = threading.Thread(target=compact)
+    compacting.start()
+    for thread in appenders:
+        thread.start()
+    for thread in appenders:
+        thread.join()
+    done.set()
+    compacting.join()
+
+    for loaded in (writer.load(), CsvFeeStore(path, year=YEAR).load()):
+        assert sorted(loaded[KEY_COLUMN]) == sorted(keys)
+    compactor.compact()
+    assert sorted(CsvFeeStore(path, year=YEAR).load()[KEY_COLUMN]) == sorted(keys)
+
+
+def test_threaded_group_commit_returns_every_key(store):
+    results = {}
+
+    def append(thread):
+        results[thread] = [store.append(fee_record(f"s{thread}-{i}")) for i in range(25)]
+
+    threads = [threading.Thread(target=append, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    keys = [key for thread_keys in results.values() for key in thread_keys]
+    assert len(keys) == len(set(keys)) == 200
+    df = store.load()
+    assert sorted(df[KEY_COLUMN]) == sorted(keys)
+    for thread, thread_keys in results.items():
+        names = df.set_index(KEY_COLUMN).loc[thread_keys, "Student Name"]
+        assert list(names) == [f"s{thread}-{i}" for i in range(25)]
+
+
+def test_stale_expected_version_raises_record_conflict(store):
+    key = store.append(fee_record("a"))
+    version = record_version(store.load().loc[store.locate(key)])
+
+    store.update_record(key, {"Received Amount": 500}, expected_version=version)
+    with pytest.raises(RecordConflict) as conflict:
+        store.update_record(key, {"Received Amount": 700}, expected_version=version)
+    assert conflict.value.current["Received Amount"] == 500
+    with pytest.raises(RecordConflict):
+        store.delete_record(key, expected_version=version)
+
+    current = record_version(store.load().loc[store.locate(key)])
+    store.delete_record(key, expected_version=current)
+    with pytest.raises(RecordConflict) as conflict:
+        store.update_record(key, {"Received Amount": 1}, expected_version=current)
+    assert conflict.value.current is None
+    assert store.load().empty
+
+
+def test_conflict_is_detected_across_store_instances(store):
+    other = type(store)(store.path, year=YEAR)
+    key = store.append(fee_record("a"))
+    version = record_version(store.load().loc[store.locate(key)])
+    other.update_record(key, {"Received Amount": 10})
+    with pytest.raises(RecordConflict):
+        store.update_record(key, {"Received Amount": 20}, expected_version=version)
+
+
+def test_file_lock_excludes_other_holders(tmp_path):
+    # Two FileLocks on one path hold separate OS locks, as two processes would
+    path = str(tmp_path / "fees.lock")
+    first, second = FileLock(path), FileLock(path)
+    with first.hold():
+        assert not second.acquire(blocking=False)
+        assert not second.acquire(exclusive=False, blocking=False)
+    with first.hold(exclusive=False):
+        assert second.acquire(exclusive=False, blocking=False)
+        second.release()
+        assert not second.acquire(blocking=False)
+    assert second.acquire(blocking=False)
+    second.release()
+
+
+def test_file_lock_shared_hold_cannot_be_upgraded(tmp_path):
+    lock = FileLock(str(tmp_path / "fees.lock"))
+    with lock.hold(exclusive=False):
+        with pytest.raises(RuntimeError):
+            lock.acquire()
+    with lock.hold():
+        with lock.hold(exclusive=False):
+            pass
+
+
+def test_persisted_views_are_saved_after_writes_off_the_write_path(tmp_path, monkeypatch):
+    from reports import CollectionTotals  # registers the collection_totals view
+
+    monkeypatch.setattr(CsvFeeStore, "VIEW_SAVE_DELAY", 0.05)
+    path = str(tmp_path / "fees.csv")
+    store = CsvFeeStore(path, year=YEAR)
+    store.append(fee_record("a"))
+    store.view("collection_totals")
+    store.append(fee_record("b", received=600))
+
+    # The append itself left the saved copy at the previous version
+    reader = CsvFeeStore(path, year=YEAR)
+    assert reader._restore_view("collection_totals", reader.version()) is None
+
+    store._view_saver.join()
+    restored = reader._restore_view("collection_totals", reader.version())
+    assert restored is not None
+    assert restored.cells == CollectionTotals.from_frame(reader.load()).cells
+
+
+def test_rows_appended_after_a_projected_read_get_their_own_row_ids(tmp_path):
+    from reports import StudentDirectory  # registers the student_directory view
+
+    path = str(tmp_path / "fees.csv")
+    first, second = CsvFeeStore(path, year=YEAR), CsvFeeStore(path, year=YEAR)
+    first.append(fee_record("a"))
+    first.load()
+    second.append(fee_record("b0"))
+    second.append(fee_record("b1"))
+
+    directory = first.view("student_directory")
+    first.append(fee_record("new"))
+    df = first.load()
+    assert list(df.loc[directory.rows("KGI", "new"), "Student Name"]) == ["new"]
+    assert list(df.loc[directory.rows("KGI", "b0"), "Student Name"]) == ["b0"]
+    assert directory.rows("KGI", "new") == StudentDirectory(df).rows("KGI", "new")
+
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_archived_partition_refuses_writes_from_stores_opened_before(tmp_path, monkeypatch, backend):
+    monkeypatch.chdir(tmp_path)
+    year = "2020-21"
+    path = partition_path(backend, year)
+    store = type(get_store(year, backend))(path, year=year)
+    store.append(dict(fee_record("a"), Date="10-05-2020"))
+    store.load()
+
+    archive_year(year, backend)
+    with pytest.raises(ValueError, match="archived"):
+        store.append(dict(fee_record("late"), Date="10-06-2020"))
+    assert list(ArchivedFeeStore(archive_path(year), year).load()["Student Name"]) == ["a"]
+    # Only the lock file the refused writer waited on may be left
+    assert [file for file in store.files() if os.path.exists(file)] == [store._file_lock.path]
+    assert isinstance(get_store(year, backend), ArchivedFeeStore)
+
+
+def test_csv_log_is_replayed_without_a_snapshot(tmp_path):
+    path = str(tmp_path / "fees.csv")
+    store = CsvFeeStore(path, year=YEAR)
+    store.ensure_initialized()
+    store.append(fee_record("a"))
+    os.remove(path)
+    assert list(CsvFeeStore(path, year=YEAR).load()["Student Name"]) == ["a"]
+
+
+def test_append_after_a_torn_log_line_is_kept(tmp_path):
+    path = str(tmp_path / "fees.csv")
+    store = CsvFeeStore(path, year=YEAR)
+    store.append(fee_record("a"))
+    with open(store.log_path, 'ab') as f:
+        f.write(b'{"op":"insert","key":"k-torn","val')  # crash mid-write
+
+    key = CsvFeeStore(path, year=YEAR).append(fee_record("b"))
+    df = CsvFeeStore(path, year=YEAR).load()
+    assert list(df["Student Name"]) == ["a", "b"]
+    assert key in set(df[KEY_COLUMN])
+
+
+@pytest.mark.skipif(not CsvFeeStore.COLUMNAR, reason="needs pyarrow")
+def test_columnar_snapshot_is_not_stamped_with_a_csv_swapped_in_while_parsing(tmp_path, monkeypatch):
+    path = str(tmp_path / "fees.csv")
+    writer = CsvFeeStore(path, year=YEAR)
+    writer.append(fee_record("a"))
+    writer.compact()
+    writer.append(fee_record("b"))
+    full = writer.load()
+
+    reader = CsvFeeStore(path, year=YEAR)
+    os.remove(reader.columnar_path)
+    read_csv = reader._read_csv
+
+    def read_old_csv_then_compact():
+        old = read_csv()
+        # A compaction writes the new snapshot meanwhile (without the write lock)
+        write_csv_atomically(format_for_storage(full), path)
+        return old
+
+    monkeypatch.setattr(reader, "_read_csv", read_old_csv_then_compact)
+    assert list(reader.load()["Student Name"]) == ["a", "b"]
+    # ... and then trims the log it folded in
+    os.remove(writer.log_path)
+    assert list(CsvFeeStore(path, year=YEAR).load()["Student Name"]) == ["a", "b"]